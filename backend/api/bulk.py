@@ -0,0 +1,152 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+
+from api.serializers import ProductSerializer
+from core.carts import recalculate_cart_totals
+from core.images import save_gallery
+from core.prices import refresh_price_ranges
+from core.sequences import PRODUCT_ARTICLE, reserve
+from products.models import Product, ShoppingCart
+
+
+class ProductBulkWriter:
+    '''Создание и изменение товаров продавца списком.
+
+    Каждый элемент проверяется `ProductSerializer` отдельно, а прошедшие
+    проверку записываются в одной транзакции пакетными запросами. Для
+    каждого элемента возвращается свой результат: `index` в исходном
+    списке, `status` и `id` товара или `errors`.
+    '''
+
+    batch_size = settings.PRODUCT_BULK_BATCH_SIZE
+
+    def __init__(self, request):
+        self.request = request
+        self.context = {'request': request}
+        self.results = []
+
+    def add_error(self, index, errors):
+        self.results.append(
+            {
+                'index': index,
+                'status': status.HTTP_400_BAD_REQUEST,
+                'errors': errors,
+            },
+        )
+
+    def add_success(self, index, product, status_code):
+        self.results.append(
+            {
+                'index': index,
+                'status': status_code,
+                'id': product.id,
+                'article': product.article,
+            },
+        )
+
+    def validate(self, index, serializer):
+        if serializer.is_valid():
+            return dict(serializer.validated_data)
+        self.add_error(index, serializer.errors)
+        return None
+
+    def create(self, items):
+        valid = []
+        for index, item in enumerate(items):
+            data = self.validate(
+                index,
+                ProductSerializer(data=item, context=self.context),
+            )
+            if data is not None:
+                valid.append((index, data, data.pop('images', [])))
+        if valid:
+            with transaction.atomic():
+                articles = reserve(PRODUCT_ARTICLE, len(valid))
+                products = Product.objects.bulk_create(
+                    [
+                        Product(
+                            user=self.request.user,
+                            article=article,
+                            **data,
+                        )
+                        for article, (_, data, _) in zip(articles, valid)
+                    ],
+                    batch_size=self.batch_size,
+                )
+                for product, (index, _, images) in zip(products, valid):
+                    if images:
+                        save_gallery(product, images)
+                    self.add_success(index, product, status.HTTP_201_CREATED)
+                transaction.on_commit(refresh_price_ranges)
+        return self.get_response_status(status.HTTP_201_CREATED)
+
+    def update(self, items):
+        products = Product.objects.filter(
+            user=self.request.user,
+            pk__in=[
+                item.get('id')
+                for item in items
+                if isinstance(item, dict) and isinstance(item.get('id'), int)
+            ],
+        ).in_bulk()
+        valid = []
+        for index, item in enumerate(items):
+            product = (
+                products.get(item.get('id'))
+                if isinstance(item, dict)
+                else None
+            )
+            if product is None:
+                self.add_error(index, {'id': ['Товар не найден.']})
+                continue
+            data = self.validate(
+                index,
+                ProductSerializer(
+                    product,
+                    data=item,
+                    partial=True,
+                    context=self.context,
+                ),
+            )
+            if data is not None:
+                valid.append((index, product, data, data.pop('images', None)))
+        if valid:
+            now = timezone.now()
+            fields = {'modified'}
+            for _, product, data, _ in valid:
+                for field, value in data.items():
+                    setattr(product, field, value)
+                product.modified = now
+                fields.update(data)
+            with transaction.atomic():
+                Product.objects.bulk_update(
+                    [product for _, product, _, _ in valid],
+                    fields,
+                    batch_size=self.batch_size,
+                )
+                if 'price' in fields:
+                    recalculate_cart_totals(
+                        ShoppingCart.objects.filter(
+                            items__in=[product for _, product, _, _ in valid],
+                        ),
+                    )
+                for index, product, _, images in valid:
+                    if images is not None:
+                        save_gallery(product, images)
+                    self.add_success(index, product, status.HTTP_200_OK)
+                transaction.on_commit(refresh_price_ranges)
+        return self.get_response_status(status.HTTP_200_OK)
+
+    def get_response_status(self, success_status):
+        self.results.sort(key=lambda result: result['index'])
+        failed = sum(
+            result['status'] == status.HTTP_400_BAD_REQUEST
+            for result in self.results
+        )
+        if not failed:
+            return success_status
+        if failed == len(self.results):
+            return status.HTTP_400_BAD_REQUEST
+        return status.HTTP_207_MULTI_STATUS
@@ -1,15 +1,100 @@
 import base64
+import binascii
+from io import BytesIO
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import (
+    InMemoryUploadedFile,
+    TemporaryUploadedFile,
+)
+from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
+from core.images import get_srcset
+from core.registry import category_registry
+from products.models import Category
+
 
 class Base64ImageField(serializers.ImageField):
+    '''Изображение в виде data URI или файла из multipart-запроса.
+
+    Строка длиннее base64 допустимого размера с запасом на переносы строк
+    отклоняется сразу. Base64 декодируется частями без копирования всей
+    строки: небольшие изображения - в память, а больше
+    `FILE_UPLOAD_MAX_MEMORY_SIZE` - во временный файл, как при обычной
+    загрузке файла. Декодирование прерывается, как только размер
+    изображения превысит допустимый.
+    '''
+
+    default_error_messages = {
+        'too_large': 'Размер изображения не должен превышать {max_size} байт.',
+        'invalid_base64': 'Некорректное изображение в формате base64.',
+    }
+    separator = ';base64,'
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='image.' + ext)
+            data = self.decode(data)
+        elif getattr(data, 'size', 0) > settings.MAX_IMAGE_UPLOAD_SIZE:
+            self.fail('too_large', max_size=settings.MAX_IMAGE_UPLOAD_SIZE)
+        return super().to_internal_value(data)
+
+    def decode(self, data):
+        position = data.find(self.separator)
+        if position == -1:
+            self.fail('invalid_base64')
+        content_type = data[:position].split(':')[-1]
+        start = position + len(self.separator)
+        max_size = settings.MAX_IMAGE_UPLOAD_SIZE
+        max_length = (max_size + 2) // 3 * 4
+        # Перенос строки из двух символов после каждых 76 символов.
+        if len(data) - start > max_length + max_length // 38 + 2:
+            self.fail('too_large', max_size=max_size)
+        name = 'image.' + content_type.split('/')[-1]
+        estimate = (len(data) - start) // 4 * 3
+        if estimate > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            file = TemporaryUploadedFile(name, content_type, estimate, None)
+        else:
+            file = InMemoryUploadedFile(
+                BytesIO(),
+                None,
+                name,
+                content_type,
+                estimate,
+                None,
+            )
+        chunk_size = settings.BASE64_DECODE_CHUNK_SIZE
+        size, rest = 0, ''
+        try:
+            for offset in range(start, len(data), chunk_size):
+                end = offset + chunk_size
+                chunk = rest + ''.join(data[offset:end].split())
+                end = len(chunk) - len(chunk) % 4
+                decoded = base64.b64decode(chunk[:end], validate=True)
+                rest = chunk[end:]
+                size += len(decoded)
+                if size > max_size:
+                    file.close()
+                    self.fail('too_large', max_size=max_size)
+                file.write(decoded)
+            if rest:
+                raise binascii.Error
+        except binascii.Error:
+            file.close()
+            self.fail('invalid_base64')
+        file.size = size
+        file.seek(0)
+        return file
+
+
+class GalleryImageField(Base64ImageField):
+    '''Новое изображение галереи или `id` уже загруженного.'''
+
+    def to_internal_value(self, data):
+        if isinstance(data, int) and not isinstance(data, bool):
+            return data
+        if isinstance(data, str) and data.isdigit():
+            return int(data)
         return super().to_internal_value(data)
 
 
@@ -19,6 +104,72 @@ class ListImagesField(serializers.ListField):
             {
                 'id': f'{item.id}',
                 'image': self.child.to_representation(item.image),
+                'srcset': get_srcset(
+                    item.image_derivatives,
+                    self.context.get('request'),
+                ),
             }
             for item in data.all()
         ]
+
+
+@extend_schema_field(
+    {
+        'type': 'object',
+        'nullable': True,
+        'example': {
+            'png': 'http://host/media/image_320w.png 320w',
+            'webp': 'http://host/media/image_320w.webp 320w',
+        },
+    }
+)
+class SrcsetField(serializers.Field):
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, derivatives):
+        return get_srcset(derivatives, self.context.get('request'))
+
+
+@extend_schema_field(
+    {'type': 'object', 'example': {'id': 1, 'name': 'string'}}
+)
+class RegistryCategoryField(serializers.Field):
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'category_id')
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, category_id):
+        return category_registry.get(category_id, self.context.get('request'))
+
+
+class CategoryIdField(serializers.IntegerField):
+    '''`id` категории, существование которой проверяется по базе.
+
+    Реестр категорий в другом процессе может быть устаревшим, поэтому
+    запись проверяется по базе. `id` категорий загружаются одним запросом
+    и запоминаются в `request`, чтобы при пакетной записи запрос был один.
+    '''
+
+    default_error_messages = {
+        'does_not_exist': 'Категория с id={value} не существует.',
+    }
+    request_attribute = '_category_ids'
+
+    def get_category_ids(self):
+        request = self.context.get('request')
+        request = getattr(request, '_request', request)
+        category_ids = getattr(request, self.request_attribute, None)
+        if category_ids is None:
+            category_ids = set(Category.objects.values_list('pk', flat=True))
+            if request is not None:
+                setattr(request, self.request_attribute, category_ids)
+        return category_ids
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        if value not in self.get_category_ids():
+            self.fail('does_not_exist', value=value)
+        return value
@@ -1,5 +1,104 @@
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from rest_framework import mixins, viewsets
 
+from core.etags import make_etag
+
+
+class NotModified(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+class ConditionalGetMixin:
+    '''Условный GET по `ETag` и `Last-Modified`.
+
+    До выполнения действий из `conditional_actions` вьюсет считает
+    валидаторы: части `ETag` из `get_etag_parts` и, где это возможно,
+    время изменения из `get_last_modified`. Если данные у клиента
+    актуальны, сразу отдаётся `304 Not Modified` без сериализации.
+    '''
+
+    conditional_actions = ('list', 'retrieve')
+    filtered_queryset = None
+
+    def get_etag_parts(self):
+        '''Части `ETag` или `None`, если ответ не проверяется.'''
+
+        return None
+
+    def get_last_modified(self):
+        return None
+
+    def get_etag_queryset(self):
+        '''Выборка, от которой зависит ответ действия.
+
+        Для списка это отфильтрованная выборка: она запоминается и потом
+        используется в `list`, чтобы фильтры и поиск не выполнялись
+        дважды. Для объекта - выборка по `pk` из URL или `None`, если
+        `pk` некорректен, и тогда ошибку отдаёт обычная обработка.
+        '''
+
+        queryset = self.get_queryset()
+        if self.action == 'list':
+            self.filtered_queryset = self.filter_queryset(queryset)
+            return self.filtered_queryset
+        try:
+            return queryset.filter(pk=self.kwargs[self.lookup_field])
+        except (TypeError, ValueError):
+            return None
+
+    def filter_queryset(self, queryset):
+        if self.filtered_queryset is not None:
+            return self.filtered_queryset
+        return super().filter_queryset(queryset)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = self.last_modified = None
+        if (
+            request.method not in ('GET', 'HEAD')
+            or self.action not in self.conditional_actions
+        ):
+            return
+        parts = self.get_etag_parts()
+        if parts is None:
+            return
+        self.etag = make_etag(self.action, request.get_full_path(), *parts)
+        self.last_modified = self.get_last_modified()
+        response = get_conditional_response(
+            request,
+            etag=self.etag,
+            last_modified=(
+                int(self.last_modified.timestamp())
+                if self.last_modified
+                else None
+            ),
+        )
+        if response is not None:
+            raise NotModified(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request,
+            response,
+            *args,
+            **kwargs,
+        )
+        if getattr(self, 'etag', None) and response.status_code in (200, 304):
+            response['ETag'] = self.etag
+            if self.last_modified:
+                response['Last-Modified'] = http_date(
+                    self.last_modified.timestamp(),
+                )
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
 
 class ListRetrieveAPIView(
     mixins.ListModelMixin,
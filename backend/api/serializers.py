@@ -1,15 +1,32 @@
-from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Sum
+from django.db import models, transaction
+from django.db.models import prefetch_related_objects
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 
-from api.fields import Base64ImageField, ListImagesField
+from api.fields import (
+    Base64ImageField,
+    CategoryIdField,
+    GalleryImageField,
+    ListImagesField,
+    RegistryCategoryField,
+    SrcsetField,
+)
+from core.carts import CART_OPERATIONS, MAX_LINE_QUANTITY, SET_QUANTITY
+from core.images import get_srcset, save_gallery
+from core.loaders import (
+    BUYING,
+    FAVORITED,
+    IN_SHOPPING_CART,
+    get_product_flags_loader,
+    load_product_flag,
+)
 from core.utils import (
-    check_is_buying,
-    check_is_favorited,
-    check_is_in_shopping_cart,
-    find_rating,
+    CartSnapshot,
+    gallery_prefetch,
+    get_rating,
+    get_storefront,
 )
 from core.validators import (
     validate_cart,
@@ -20,7 +37,6 @@ from products.models import (
     Category,
     Favorite,
     Image,
-    ImageProduct,
     Order,
     OrderProductList,
     Product,
@@ -28,33 +44,49 @@ from products.models import (
     ShoppingCart,
     ShoppingCart_Items,
 )
-from users.models import Seller
 from users.serializers import CustomUserSerializer
 
 
 class CategorySerializer(serializers.ModelSerializer):
+    image_url = serializers.SerializerMethodField()
+
     class Meta:
         model = Category
         fields = '__all__'
 
+    @extend_schema_field({'type': 'string', 'example': 'string'})
+    def get_image_url(self, object):
+        if object.image is None or not object.image.image:
+            return None
+        return object.image.image.url
+
+
+class ProductFlagsListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if isinstance(data, models.manager.BaseManager):
+            data = data.all()
+        data = list(data)
+        get_product_flags_loader(self.context.get('request')).prime(
+            product.id for product in data
+        )
+        return super().to_representation(data)
+
 
 class ImageSerializer(serializers.ModelSerializer):
     image = Base64ImageField(required=False)
+    srcset = SrcsetField(source='image_derivatives')
 
     class Meta:
         model = Image
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'srcset')
 
 
 class ProductSerializer(serializers.ModelSerializer):
     images = ListImagesField(
-        child=Base64ImageField(),
+        child=GalleryImageField(),
         required=False,
     )
-    category = serializers.SlugRelatedField(
-        slug_field='id',
-        queryset=Category.objects.all(),
-    )
+    category = CategoryIdField(source='category_id')
 
     class Meta:
         model = Product
@@ -80,42 +112,43 @@ class ProductSerializer(serializers.ModelSerializer):
             'modified',
         )
 
+    @transaction.atomic
     def create(self, validated_data):
-        if 'images' in self.initial_data:
-            images = validated_data.pop('images')
+        images = validated_data.pop('images', [])
         product = Product.objects.create(**validated_data)
-        if 'images' in self.initial_data:
-            for image in images:
-                current_image = Image.objects.create(
-                    user=product.user,
-                    image=image,
-                )
-                ImageProduct.objects.create(
-                    image=current_image,
-                    product=product,
-                )
+        save_gallery(product, images)
         return product
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         method = self.context['request'].method
         if method == 'PUT':
             instance.video = None
-        if 'images' in self.initial_data:
-            instance.images.clear()
-            images = validated_data.pop('images')
-            for image in images:
-                current_image = Image.objects.create(
-                    user=instance.user,
-                    image=image,
-                )
-                ImageProduct.objects.create(
-                    image=current_image,
-                    product=instance,
-                )
+        if 'images' in validated_data:
+            save_gallery(instance, validated_data.pop('images'))
         elif method == 'PUT':
-            instance.images.clear()
+            save_gallery(instance, [])
         return super().update(instance, validated_data)
 
+    def to_representation(self, instance):
+        prefetch_related_objects([instance], gallery_prefetch())
+        return super().to_representation(instance)
+
+    def validate_images(self, value):
+        image_ids = {image for image in value if isinstance(image, int)}
+        found = set(
+            Image.objects.filter(
+                user=self.context['request'].user,
+                pk__in=image_ids,
+            ).values_list('pk', flat=True),
+        )
+        if image_ids - found:
+            raise serializers.ValidationError(
+                'Изображения не найдены: '
+                + ', '.join(map(str, sorted(image_ids - found))),
+            )
+        return value
+
     def validate(self, data):
         if self.context['request'].user.is_seller is False:
             raise serializers.ValidationError(
@@ -125,11 +158,14 @@ class ProductSerializer(serializers.ModelSerializer):
 
 
 class ProductListSerializer(serializers.ModelSerializer):
-    category = CategorySerializer()
+    category = RegistryCategoryField()
     images = ImageSerializer(many=True)
     rating = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    logo = serializers.SerializerMethodField()
+    logo_srcset = serializers.SerializerMethodField()
+    store_name = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
@@ -146,35 +182,63 @@ class ProductListSerializer(serializers.ModelSerializer):
             'category',
             'is_favorited',
             'is_in_shopping_cart',
+            'logo',
+            'logo_srcset',
+            'store_name',
             'is_active',
             'created',
             'modified',
         )
+        list_serializer_class = ProductFlagsListSerializer
 
     @extend_schema_field({'example': [4.5, 2]})
     def get_rating(self, object):
-        return find_rating(object.id)
+        return get_rating(object)
 
     @extend_schema_field({'type': 'boolean', 'example': True})
     def get_is_favorited(self, object):
-        return check_is_favorited(self.context.get('request').user, object.id)
+        return load_product_flag(
+            self.context.get('request'),
+            FAVORITED,
+            object.id,
+        )
 
     @extend_schema_field({'type': 'boolean', 'example': False})
     def get_is_in_shopping_cart(self, object):
-        return check_is_in_shopping_cart(
-            self.context.get('request').user,
+        return load_product_flag(
+            self.context.get('request'),
+            IN_SHOPPING_CART,
             object.id,
         )
 
+    @extend_schema_field({'type': 'string', 'example': 'string'})
+    def get_store_name(self, object):
+        return get_storefront(object)[0]
+
+    @extend_schema_field({'type': 'string', 'example': 'string'})
+    def get_logo(self, object):
+        logo = get_storefront(object)[1]
+        if logo is None:
+            return None
+        return self.context.get('request').build_absolute_uri(logo)
+
+    @extend_schema_field(SrcsetField)
+    def get_logo_srcset(self, object):
+        return get_srcset(
+            get_storefront(object)[2],
+            self.context.get('request'),
+        )
+
 
 class ProductRetrieveSerializer(serializers.ModelSerializer):
-    category = CategorySerializer()
+    category = RegistryCategoryField()
     images = ImageSerializer(many=True)
     rating = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     is_buying = serializers.SerializerMethodField()
     logo = serializers.SerializerMethodField()
+    logo_srcset = serializers.SerializerMethodField()
     store_name = serializers.SerializerMethodField()
 
     class Meta:
@@ -194,46 +258,59 @@ class ProductRetrieveSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'is_buying',
             'logo',
+            'logo_srcset',
             'store_name',
             'is_active',
             'created',
             'modified',
         )
+        list_serializer_class = ProductFlagsListSerializer
 
     @extend_schema_field({'example': [4.5, 2]})
     def get_rating(self, object):
-        return find_rating(object.id)
+        return get_rating(object)
 
     @extend_schema_field({'type': 'boolean', 'example': True})
     def get_is_favorited(self, object):
-        return check_is_favorited(self.context.get('request').user, object.id)
+        return load_product_flag(
+            self.context.get('request'),
+            FAVORITED,
+            object.id,
+        )
 
     @extend_schema_field({'type': 'boolean', 'example': False})
     def get_is_in_shopping_cart(self, object):
-        return check_is_in_shopping_cart(
-            self.context.get('request').user,
+        return load_product_flag(
+            self.context.get('request'),
+            IN_SHOPPING_CART,
             object.id,
         )
 
     @extend_schema_field({'type': 'boolean', 'example': True})
     def get_is_buying(self, object):
-        return check_is_buying(self.context.get('request').user, object.id)
+        return load_product_flag(
+            self.context.get('request'),
+            BUYING,
+            object.id,
+        )
 
     @extend_schema_field({'type': 'string', 'example': 'string'})
     def get_store_name(self, object):
-        try:
-            return Seller.objects.get(user=object.user).store_name
-        except ObjectDoesNotExist:
-            return None
+        return get_storefront(object)[0]
 
     @extend_schema_field({'type': 'string', 'example': 'string'})
     def get_logo(self, object):
-        try:
-            return self.context.get('request').build_absolute_uri(
-                Seller.objects.get(user=object.user).logo.url,
-            )
-        except (ObjectDoesNotExist, ValueError):
+        logo = get_storefront(object)[1]
+        if logo is None:
             return None
+        return self.context.get('request').build_absolute_uri(logo)
+
+    @extend_schema_field(SrcsetField)
+    def get_logo_srcset(self, object):
+        return get_srcset(
+            get_storefront(object)[2],
+            self.context.get('request'),
+        )
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -300,7 +377,7 @@ class ItemSerializer(serializers.ModelSerializer):
     cost = serializers.SerializerMethodField()
     in_favorite = serializers.SerializerMethodField()
     is_selected = serializers.SerializerMethodField()
-    category = CategorySerializer(read_only=True)
+    category = RegistryCategoryField()
 
     class Meta:
         model = Product
@@ -316,34 +393,32 @@ class ItemSerializer(serializers.ModelSerializer):
             'quantity',
             'is_selected',
         )
+        list_serializer_class = ProductFlagsListSerializer
 
     def get_quantity(self, obj):
-        owner = self.context.get('request').user
-        return ShoppingCart_Items.objects.get(
-            item=obj,
-            cart_id=owner.user_cart.id,
-        ).quantity
+        return obj.cart_quantity
 
     def get_cost(self, obj):
-        return obj.price * self.get_quantity(obj)
+        return obj.price * obj.cart_quantity
 
     def get_in_favorite(self, obj):
-        owner = self.context.get('request').user
-        return Favorite.objects.filter(user=owner, product=obj).exists()
+        return load_product_flag(
+            self.context.get('request'),
+            FAVORITED,
+            obj.id,
+        )
 
     def get_is_selected(self, obj):
-        owner = self.context.get('request').user
-        return ShoppingCart_Items.objects.get(
-            item=obj,
-            cart_id=owner.user_cart.id,
-        ).is_selected
+        return obj.cart_is_selected
 
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
-    total_cost = serializers.SerializerMethodField()
-    total_amount = serializers.SerializerMethodField()
+    '''Корзина с сохранёнными итогами и строками из `CartSnapshot`.'''
+
+    total_cost = serializers.IntegerField(source='selected_cost')
+    total_amount = serializers.IntegerField(source='selected_quantity')
     total_quantity = serializers.SerializerMethodField()
-    items = ItemSerializer(read_only=True, many=True)
+    items = serializers.SerializerMethodField()
     discount_amount = serializers.SerializerMethodField()
 
     class Meta:
@@ -355,30 +430,102 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
             'total_quantity',
             'discount_amount',
             'discount',
+            'version',
             'items',
         )
 
-    def get_total_cost(self, obj):
-        cart = ShoppingCart_Items.objects.filter(cart=obj, is_selected=True)
-        return sum([item.quantity * item.item.price for item in cart])
-
-    def get_total_amount(self, obj):
-        cart = ShoppingCart_Items.objects.filter(cart=obj, is_selected=True)
-        return sum([i.quantity for i in cart])
-
     def get_total_quantity(self, obj):
-        return (
-            ShoppingCart_Items.objects.filter(cart=obj)
-            .aggregate(total_quantity=Sum('quantity'))
-            .get('total_quantity')
-        )
+        return obj.total_quantity or None
+
+    @extend_schema_field(ItemSerializer(many=True))
+    def get_items(self, obj):
+        return ItemSerializer(
+            CartSnapshot(obj).products,
+            many=True,
+            context=self.context,
+        ).data
 
     def get_discount_amount(self, obj):
         if obj.discount:
-            total_cost = self.get_total_cost(obj)
+            total_cost = obj.selected_cost
             return int(total_cost - (total_cost / 100 * obj.discount))
 
 
+class CartLineSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    quantity = serializers.IntegerField()
+    is_selected = serializers.BooleanField()
+    cost = serializers.IntegerField()
+
+
+class ShoppingCartDeltaSerializer(ShoppingCartSerializer):
+    '''Итоги и версия корзины со строками, изменёнными запросом.
+
+    Строки передаются в контексте `lines` тройками
+    `(id товара, цена, (кол-во, выбрана ли))`.
+    '''
+
+    items = None
+    changed = serializers.SerializerMethodField()
+    removed = serializers.SerializerMethodField()
+
+    class Meta(ShoppingCartSerializer.Meta):
+        fields = (
+            'id',
+            'version',
+            'total_cost',
+            'total_amount',
+            'total_quantity',
+            'discount_amount',
+            'discount',
+            'changed',
+            'removed',
+        )
+
+    @extend_schema_field(CartLineSerializer(many=True))
+    def get_changed(self, obj):
+        lines = self.context['lines']
+        return [
+            {
+                'id': product_id,
+                'quantity': quantity,
+                'is_selected': is_selected,
+                'cost': price * quantity,
+            }
+            for product_id, price, (quantity, is_selected) in lines
+            if quantity
+        ]
+
+    @extend_schema_field(
+        serializers.ListField(child=serializers.IntegerField()),
+    )
+    def get_removed(self, obj):
+        return [
+            product_id
+            for product_id, _, (quantity, _) in self.context['lines']
+            if not quantity
+        ]
+
+
+class CartOperationSerializer(serializers.Serializer):
+    '''Операция пакетного изменения корзины.'''
+
+    operation = serializers.ChoiceField(choices=CART_OPERATIONS)
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(
+        min_value=1,
+        max_value=MAX_LINE_QUANTITY,
+        required=False,
+    )
+
+    def validate(self, data):
+        if data['operation'] == SET_QUANTITY and 'quantity' not in data:
+            raise serializers.ValidationError(
+                {'quantity': 'Обязательное поле.'},
+            )
+        return data
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Favorite
@@ -406,7 +553,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
     quantity = serializers.SerializerMethodField()
     cost = serializers.SerializerMethodField()
     in_favorite = serializers.SerializerMethodField()
-    category = CategorySerializer(read_only=True)
+    category = RegistryCategoryField()
 
     def get_quantity(self, obj):
         user = self.context.get('request').user
@@ -422,8 +569,11 @@ class OrderItemSerializer(serializers.ModelSerializer):
         return obj.price * self.get_quantity(obj)
 
     def get_in_favorite(self, obj):
-        user = self.context.get('request').user
-        return Favorite.objects.filter(user=user, product=obj).exists()
+        return load_product_flag(
+            self.context.get('request'),
+            FAVORITED,
+            obj.id,
+        )
 
     class Meta:
         model = Product
@@ -438,6 +588,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
             'cost',
             'quantity',
         )
+        list_serializer_class = ProductFlagsListSerializer
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -463,16 +614,35 @@ class OrderSerializer(serializers.ModelSerializer):
         )
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
+        '''Оформление заказа из выбранных товаров корзины.
+
+        Корзина блокируется до конца транзакции, поэтому повторная отправка
+        дождётся первой и получит пустую корзину, а не второй заказ.
+        '''
+
         user = self.context.get('request').user
-        cart = ShoppingCart_Items.objects.filter(
-            cart__owner=user,
-            is_selected=True,
+        cart = (
+            ShoppingCart.objects.select_for_update().filter(owner=user).first()
+        )
+        lines = (
+            list(
+                ShoppingCart_Items.objects.filter(
+                    cart=cart,
+                    is_selected=True,
+                ).values_list('item_id', 'quantity', 'item__price'),
+            )
+            if cart is not None
+            else []
         )
-        price = sum([item.quantity * item.item.price for item in cart])
-        discount = ShoppingCart.objects.get(owner=user).discount
-        if discount:
-            total_cost = int(price - (price * discount) / 100)
+        if not lines:
+            raise serializers.ValidationError(
+                {'message': 'Ваша корзина пуста.'},
+            )
+        price = sum(quantity * price for _, quantity, price in lines)
+        if cart.discount:
+            total_cost = int(price - (price * cart.discount) / 100)
         else:
             total_cost = price
         order = Order.objects.create(
@@ -481,16 +651,21 @@ class OrderSerializer(serializers.ModelSerializer):
             send_to=validated_data.get('send_to'),
             total_cost=total_cost,
         )
-        for item in cart:
-            OrderProductList.objects.create(
-                order=order,
-                product=item.item,
-                quantity=item.quantity,
+        OrderProductList.objects.bulk_create(
+            OrderProductList(
+                order=order, product_id=item_id, quantity=quantity
             )
-        ShoppingCart_Items.objects.filter(cart__owner=user).delete()
-        user_cart = ShoppingCart.objects.get(owner=user)
-        user_cart.discount = None
-        user_cart.save()
+            for item_id, quantity, _ in lines
+        )
+        ShoppingCart_Items.objects.filter(cart=cart).delete()
+        ShoppingCart.objects.filter(pk=cart.pk).update(
+            discount=None,
+            total_quantity=0,
+            selected_quantity=0,
+            selected_cost=0,
+            version=models.F('version') + 1,
+            modified=timezone.now(),
+        )
         return order
 
     class Meta:
@@ -0,0 +1,127 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from core.carts import get_drifted_carts, recalculate_cart_totals
+from products.models import Category, Product, ShoppingCart, ShoppingCart_Items
+from users.models import User
+
+
+class CartTotalsTest(TestCase):
+    '''Сохранённые итоги корзины совпадают с её строками.'''
+
+    def setUp(self):
+        seller = User.objects.create_user(
+            'seller@example.com',
+            'password',
+            username='seller',
+            is_seller=True,
+        )
+        self.buyer = User.objects.create_user(
+            'buyer@example.com',
+            'password',
+            username='buyer',
+        )
+        category = Category.objects.create(name='Категория')
+        self.products = [
+            Product.objects.create(
+                user=seller,
+                name=f'Бот {number}',
+                description='Описание бота',
+                price=price,
+                category=category,
+            )
+            for number, price in enumerate((100, 250, 400, 1000))
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def get_lines(self):
+        return {
+            item_id: (quantity, is_selected)
+            for item_id, quantity, is_selected in (
+                ShoppingCart_Items.objects.filter(
+                    cart__owner=self.buyer,
+                ).values_list('item_id', 'quantity', 'is_selected')
+            )
+        }
+
+    def assert_totals(self, total_quantity, selected_quantity, selected_cost):
+        cart = ShoppingCart.objects.get(owner=self.buyer)
+        self.assertEqual(
+            (cart.total_quantity, cart.selected_quantity, cart.selected_cost),
+            (total_quantity, selected_quantity, selected_cost),
+        )
+        self.assertFalse(get_drifted_carts().exists())
+
+    def test_batch_with_mixed_operations(self):
+        first, second, third, fourth = self.products
+        cart = ShoppingCart.objects.create(owner=self.buyer)
+        for product, quantity, is_selected in (
+            (first, 2, True),
+            (second, 3, True),
+            (third, 1, False),
+        ):
+            ShoppingCart_Items.objects.create(
+                cart=cart,
+                item=product,
+                quantity=quantity,
+                is_selected=is_selected,
+            )
+        recalculate_cart_totals(ShoppingCart.objects.filter(pk=cart.pk))
+        self.assert_totals(6, 5, 2 * 100 + 3 * 250)
+        response = self.client.post(
+            '/api/cart/batch/',
+            [
+                {'operation': 'add', 'product': first.pk, 'quantity': 3},
+                {'operation': 'remove', 'product': second.pk},
+                {'operation': 'set', 'product': third.pk, 'quantity': 4},
+                {'operation': 'add', 'product': fourth.pk, 'quantity': 2},
+                {'operation': 'remove', 'product': fourth.pk, 'quantity': 1},
+            ],
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.get_lines(),
+            {
+                first.pk: (5, True),
+                third.pk: (4, False),
+                fourth.pk: (1, True),
+            },
+        )
+        self.assert_totals(10, 6, 5 * 100 + 1 * 1000)
+
+    def test_batch_with_unknown_product_changes_nothing(self):
+        first = self.products[0]
+        response = self.client.post(
+            '/api/cart/batch/',
+            [
+                {'operation': 'add', 'product': first.pk},
+                {'operation': 'add', 'product': 999999},
+            ],
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get_lines(), {})
+
+    def test_single_item_actions(self):
+        first, second, third, _ = self.products
+        for product in (first, first, first, second, third):
+            self.client.post(f'/api/products/{product.pk}/shopping_cart/')
+        self.client.patch(f'/api/products/{first.pk}/shopping_cart/')
+        self.assert_totals(4, 4, 2 * 100 + 250 + 400)
+        self.client.patch(f'/api/products/{second.pk}/select/')
+        self.assert_totals(4, 3, 2 * 100 + 400)
+        self.client.delete('/api/products/select_all/')
+        self.assert_totals(4, 0, 0)
+        self.client.patch('/api/products/select_all/')
+        self.assert_totals(4, 4, 2 * 100 + 250 + 400)
+        first.price = 150
+        first.save()
+        self.assert_totals(4, 4, 2 * 150 + 250 + 400)
+        self.client.delete(f'/api/products/{third.pk}/shopping_cart/')
+        self.assert_totals(3, 3, 2 * 150 + 250)
+        self.client.patch(f'/api/products/{second.pk}/select/')
+        self.client.delete('/api/products/delete_all_selected/')
+        self.assertEqual(self.get_lines(), {second.pk: (1, False)})
+        self.assert_totals(1, 0, 0)
@@ -0,0 +1,92 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from core.carts import add_to_cart
+from products.models import (
+    Category,
+    Favorite,
+    Image,
+    ImageProduct,
+    Product,
+    Review,
+    ShoppingCart,
+)
+from users.models import Seller, User
+
+
+class ProductListQueriesTest(TestCase):
+    '''Кол-во запросов списка товаров не зависит от кол-ва товаров.'''
+
+    def setUp(self):
+        self.seller = User.objects.create_user(
+            'seller@example.com',
+            'password',
+            username='seller',
+            is_seller=True,
+        )
+        Seller.objects.create(
+            user=self.seller,
+            inn='1234567890',
+            store_name='Магазин',
+        )
+        self.buyer = User.objects.create_user(
+            'buyer@example.com',
+            'password',
+            username='buyer',
+        )
+        self.cart = ShoppingCart.objects.create(owner=self.buyer)
+        self.categories = [
+            Category.objects.create(name=f'Категория {number}')
+            for number in range(3)
+        ]
+        self.client = APIClient()
+
+    def create_products(self, count):
+        for number in range(count):
+            product = Product.objects.create(
+                user=self.seller,
+                name=f'Бот {number}',
+                description='Описание бота',
+                price=100 + number,
+                category=self.categories[number % 3],
+            )
+            for position in range(2):
+                image = Image.objects.create(
+                    user=self.seller,
+                    image=f'products/{product.pk}_{position}.png',
+                )
+                ImageProduct.objects.create(
+                    image=image,
+                    product=product,
+                    position=position,
+                )
+            Review.objects.create(
+                user=self.buyer,
+                product=product,
+                rating=5,
+                text='Отличный бот',
+            )
+            Favorite.objects.create(user=self.buyer, product=product)
+            add_to_cart(self.cart.pk, product.pk)
+
+    def assert_constant_queries(self, url, user):
+        self.client.force_authenticate(user)
+        self.create_products(3)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 3)
+        self.create_products(37)
+        with self.assertNumQueries(len(context)):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 40)
+
+    def test_products_list(self):
+        self.assert_constant_queries('/api/products/', self.buyer)
+
+    def test_my_products_list(self):
+        self.assert_constant_queries('/api/my_products/', self.seller)
@@ -1,18 +1,26 @@
+import json
 from functools import reduce
 from operator import or_
 
-from django.db.models import F, Max, Min, Q
+from django.db import transaction
+from django.db.models import BigIntegerField, Count, Max, Min, Q
+from django.db.models.expressions import ExpressionWrapper
+from django.db.models.functions import Cast
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import (
     OpenApiParameter,
     OpenApiResponse,
+    PolymorphicProxySerializer,
     extend_schema,
     extend_schema_view,
 )
 from rest_framework import status
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.fields import BooleanField
 from rest_framework.filters import OrderingFilter
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import (
     AllowAny,
     IsAuthenticated,
@@ -21,9 +29,16 @@ from rest_framework.permissions import (
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
-from api.mixins import CRUDAPIView, ListRetrieveAPIView, OrderAPIView
+from api.bulk import ProductBulkWriter
+from api.mixins import (
+    ConditionalGetMixin,
+    CRUDAPIView,
+    ListRetrieveAPIView,
+    OrderAPIView,
+)
 from api.permissions import AuthorCanEditAndDelete, IsOwner, IsOwnerOrder
 from api.serializers import (
+    CartOperationSerializer,
     CategorySerializer,
     FavoriteSerializer,
     OrderSerializer,
@@ -32,11 +47,43 @@ from api.serializers import (
     ProductSerializer,
     ReviewListSerializer,
     ReviewSerializer,
+    ShoppingCartDeltaSerializer,
     ShoppingCartSerializer,
 )
-from backend.settings import PROMOCODE
+from backend.settings import (
+    CART_BATCH_MAX_OPERATIONS,
+    CATALOG_IMPORT_MAX_SIZE,
+    FACETS_MAX_PRICE_BUCKETS,
+    FACETS_PRICE_BUCKETS,
+    PRODUCT_BULK_MAX_ITEMS,
+    PROMOCODE,
+)
+from core.carts import (
+    EMPTY_LINE,
+    add_to_cart,
+    apply_cart_operations,
+    get_totals_delta,
+    remove_one_from_cart,
+)
+from core.catalog import (
+    CONTENT_TYPES,
+    CSV,
+    FILE_FORMATS,
+    JSONL,
+    ProductImporter,
+    export_products,
+    read_rows,
+)
+from core.etags import queryset_stamp, user_stamp
 from core.filters import NameOrDescriptionFilter
 from core.paginations import Pagination
+from core.prices import get_price_range
+from core.registry import category_registry
+from core.utils import (
+    annotate_storefront,
+    gallery_prefetch,
+    update_rating_stats,
+)
 from products.models import (
     Category,
     Favorite,
@@ -47,6 +94,55 @@ from products.models import (
     ShoppingCart_Items,
 )
 
+CART_DELTA_PARAMETER = OpenApiParameter(
+    name='delta',
+    description=(
+        'Краткий ответ: `delta=true` вместо всей корзины возвращает итоги, '
+        '`version`, изменённые строки `changed` и `id` удалённых товаров '
+        '`removed`.'
+    ),
+    required=False,
+    type=bool,
+)
+CART_RESPONSE = PolymorphicProxySerializer(
+    component_name='CartResponse',
+    serializers=[ShoppingCartSerializer, ShoppingCartDeltaSerializer],
+    resource_type_field_name=None,
+)
+
+
+class CartResponseMixin:
+    '''Ответ на изменение корзины.
+
+    По умолчанию отдаётся вся корзина, а с `?delta=true` - только итоги,
+    версия и изменённые строки, по которым клиент обновляет свою копию.
+    '''
+
+    def is_delta_response(self):
+        return (
+            self.request.query_params.get('delta') in BooleanField.TRUE_VALUES
+        )
+
+    def get_cart_response(
+        self,
+        cart,
+        lines=(),
+        response_status=status.HTTP_200_OK,
+    ):
+        '''Ответ с корзиной `cart`.
+
+        `lines` - изменённые строки тройками `(id товара, цена, строка)`,
+        где строка - пара `(кол-во, выбрана ли)`, `EMPTY_LINE` у удалённых.
+        '''
+
+        context = {'request': self.request}
+        if not self.is_delta_response():
+            serializer = ShoppingCartSerializer(cart, context=context)
+        else:
+            context['lines'] = lines
+            serializer = ShoppingCartDeltaSerializer(cart, context=context)
+        return Response(serializer.data, status=response_status)
+
 
 @extend_schema_view(
     list=extend_schema(
@@ -58,8 +154,26 @@ from products.models import (
             '`items` - боты, у которых поле `quantity` - кол-во каждого бота.'
         ),
     ),
+    batch=extend_schema(
+        summary='Изменить корзину списком операций',
+        description=(
+            'Применяет операции по порядку в одной транзакции и возвращает '
+            'корзину. `operation`: `set` - задать кол-во `quantity`, `add` '
+            '- добавить `quantity` штук (по умолчанию 1), `remove` - убрать '
+            '`quantity` штук или, без `quantity`, весь товар, `select` и '
+            '`deselect` - выбрать товар или снять выбор. Не больше '
+            f'{CART_BATCH_MAX_OPERATIONS} операций за запрос.'
+        ),
+        parameters=[CART_DELTA_PARAMETER],
+        request=CartOperationSerializer(many=True),
+        responses={status.HTTP_200_OK: CART_RESPONSE},
+    ),
 )
-class CartViewSet(ReadOnlyModelViewSet):
+class CartViewSet(
+    CartResponseMixin,
+    ConditionalGetMixin,
+    ReadOnlyModelViewSet,
+):
     '''Корзина.'''
 
     serializer_class = ShoppingCartSerializer
@@ -68,17 +182,67 @@ class CartViewSet(ReadOnlyModelViewSet):
     def get_queryset(self):
         return ShoppingCart.objects.filter(owner=self.request.user)
 
+    def get_etag_parts(self):
+        queryset = self.get_etag_queryset()
+        if queryset is None:
+            return None
+        return (
+            queryset_stamp(queryset, 'items'),
+            category_registry.get_version(self.request),
+            user_stamp(self.request.user),
+        )
+
+    @action(methods=['POST'], detail=False, permission_classes=(IsOwner,))
+    def batch(self, request, *args, **kwargs):
+        '''Пакетное изменение корзины.'''
+
+        serializer = CartOperationSerializer(
+            data=request.data,
+            many=True,
+            allow_empty=False,
+            max_length=CART_BATCH_MAX_OPERATIONS,
+        )
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data
+        prices = dict(
+            Product.objects.filter(
+                pk__in={operation['product'] for operation in operations},
+            ).values_list('pk', 'price'),
+        )
+        missing = sorted(
+            {
+                operation['product']
+                for operation in operations
+                if operation['product'] not in prices
+            },
+        )
+        if missing:
+            return Response(
+                {'errors': f'Товары не найдены: {missing}.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        with transaction.atomic():
+            cart, _ = ShoppingCart.objects.select_for_update().get_or_create(
+                owner=request.user,
+            )
+            lines = apply_cart_operations(cart, operations, prices)
+        return self.get_cart_response(cart, lines)
+
     @action(methods=['POST'], detail=False, permission_classes=(IsOwner,))
     def promocode(self, request, *args, **kwargs):
         '''Ввод промокода для скидки.'''
 
         promocode = request.data.get('promocode')
-        cart = get_object_or_404(ShoppingCart, owner=self.request.user)
+        with transaction.atomic():
+            cart = get_object_or_404(
+                ShoppingCart.objects.select_for_update(),
+                owner=self.request.user,
+            )
+            if promocode in PROMOCODE:
+                cart.bump_version(discount=PROMOCODE[promocode])
         context = {'request': request, 'promocode': PROMOCODE.get(promocode)}
         serializer = ShoppingCartSerializer(cart, context=context)
         if promocode in PROMOCODE:
-            cart.discount = PROMOCODE[promocode]
-            cart.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
         else:
             return Response(
@@ -97,12 +261,69 @@ class CartViewSet(ReadOnlyModelViewSet):
         description=('Возвращает данные конкретной категории.'),
     ),
 )
-class CategoryAPIView(ListRetrieveAPIView):
+class CategoryAPIView(ConditionalGetMixin, ListRetrieveAPIView):
     '''Категории.'''
 
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    lookup_value_regex = r'\d+'
+
+    def get_etag_parts(self):
+        return (category_registry.get_version(self.request),)
+
+    def get_last_modified(self):
+        if self.action == 'retrieve':
+            return category_registry.get_last_modified(self.request)
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return Response(category_registry.all(request))
+
+    def retrieve(self, request, pk, *args, **kwargs):
+        category = category_registry.get(int(pk), request)
+        if category is None:
+            raise Http404
+        return Response(category)
+
+
+PRODUCT_FILTER_PARAMETERS = [
+    OpenApiParameter(
+        name='category',
+        description=('Фильтрация по категориям. Передаём `id` категории.'),
+        required=False,
+        type=int,
+    ),
+    OpenApiParameter(
+        name='search',
+        description=(
+            'Полнотекстовый поиск по названию и описанию с учётом '
+            'морфологии. Число ищется сначала как артикул. Без '
+            '`ordering` результаты отсортированы по релевантности.'
+        ),
+        required=False,
+        type=str,
+    ),
+    OpenApiParameter(
+        name='price',
+        description=(
+            'Для фильтрации по цене передаём именно два параметра '
+            '`price`. Число в первом параметре `price` '
+            'рассматривается как `от`, а во втором параметре - `до`.'
+        ),
+        required=False,
+        type=int,
+    ),
+    OpenApiParameter(
+        name='is_favorited',
+        description=(
+            'Если `is_favorited=True`, то выводятся все товары, '
+            'которые текущий пользователь добавил в избранное.'
+        ),
+        required=False,
+        type=str,
+    ),
+]
 
 
 @extend_schema_view(
@@ -110,32 +331,7 @@ class CategoryAPIView(ListRetrieveAPIView):
         summary='Получить список товаров',
         description=('Возвращает список товаров.'),
         parameters=[
-            OpenApiParameter(
-                name='category',
-                description=(
-                    'Фильтрация по категориям. Передаём `id` категории.'
-                ),
-                required=False,
-                type=int,
-            ),
-            OpenApiParameter(
-                name='search',
-                description=(
-                    'Поиск по начальному вхождению, регистр учитывается.'
-                ),
-                required=False,
-                type=str,
-            ),
-            OpenApiParameter(
-                name='price',
-                description=(
-                    'Для фильтрации по цене передаём именно два параметра '
-                    '`price`. Число в первом параметре `price` '
-                    'рассматривается как `от`, а во втором параметре - `до`.'
-                ),
-                required=False,
-                type=int,
-            ),
+            *PRODUCT_FILTER_PARAMETERS,
             OpenApiParameter(
                 name='ordering',
                 description=(
@@ -148,21 +344,87 @@ class CategoryAPIView(ListRetrieveAPIView):
                 required=False,
                 type=str,
             ),
+        ],
+    ),
+    facets=extend_schema(
+        summary='Получить фасеты каталога',
+        description=(
+            'Принимает те же фильтры, что и список товаров, и возвращает '
+            '`count` - кол-во найденных товаров, `categories` - кол-во '
+            'товаров в каждой категории без учёта фильтра `category`, '
+            '`price` - минимальную и максимальную стоимость и гистограмму '
+            'цен без учёта фильтра `price`.'
+        ),
+        parameters=[
+            *PRODUCT_FILTER_PARAMETERS,
             OpenApiParameter(
-                name='is_favorited',
+                name='buckets',
                 description=(
-                    'Если `is_favorited=True`, то выводятся все товары, '
-                    'которые текущий пользователь добавил в избранное.'
+                    'Кол-во интервалов гистограммы цен, по умолчанию '
+                    f'{FACETS_PRICE_BUCKETS}, не больше '
+                    f'{FACETS_MAX_PRICE_BUCKETS}.'
                 ),
                 required=False,
-                type=str,
+                type=int,
             ),
         ],
+        responses={
+            status.HTTP_200_OK: OpenApiResponse(
+                response={
+                    'example': {
+                        'count': 3,
+                        'categories': [{'id': 1, 'count': 3}],
+                        'price': {
+                            'min': 500,
+                            'max': 1000,
+                            'histogram': [
+                                {'from': 500, 'to': 750, 'count': 2},
+                                {'from': 751, 'to': 1000, 'count': 1},
+                            ],
+                        },
+                    },
+                },
+            ),
+        },
     ),
     create=extend_schema(
         summary='Создать товар',
         description=('Создать товар.'),
     ),
+    bulk=extend_schema(
+        summary='Создать или изменить товары списком',
+        description=(
+            '`POST` создаёт, а `PATCH` частично изменяет товары из списка, '
+            'для изменения в каждом элементе передаётся `id`. Не больше '
+            f'{PRODUCT_BULK_MAX_ITEMS} товаров за запрос. Для каждого '
+            'элемента в `results` возвращается `index` в списке, `status` '
+            'и `id` с `article` товара или `errors`. Статус ответа - `201` '
+            'или `200`, если записаны все товары, `207`, если часть, и '
+            '`400`, если ни один.'
+        ),
+        request=ProductSerializer(many=True),
+        responses={
+            status.HTTP_201_CREATED: OpenApiResponse(
+                response={
+                    'example': {
+                        'results': [
+                            {
+                                'index': 0,
+                                'status': 201,
+                                'id': 1,
+                                'article': 100000,
+                            },
+                            {
+                                'index': 1,
+                                'status': 400,
+                                'errors': {'price': ['Обязательное поле.']},
+                            },
+                        ],
+                    },
+                },
+            ),
+        },
+    ),
     retrieve=extend_schema(
         summary='Получить данные конкретного товара',
         description=('Возвращает данные конкретного товара.'),
@@ -179,8 +441,38 @@ class CategoryAPIView(ListRetrieveAPIView):
         summary='Удалить товар',
         description=('Удалить товар.'),
     ),
+    shopping_cart=extend_schema(
+        summary='Изменить кол-во товара в корзине',
+        description=(
+            '`POST` добавляет товар или увеличивает его кол-во, `PATCH` '
+            'уменьшает кол-во на один, `DELETE` удаляет товар из корзины.'
+        ),
+        parameters=[CART_DELTA_PARAMETER],
+        request=None,
+        responses={
+            status.HTTP_200_OK: CART_RESPONSE,
+            status.HTTP_201_CREATED: CART_RESPONSE,
+        },
+    ),
+    select=extend_schema(
+        summary='Выбрать товар в корзине или снять выбор',
+        parameters=[CART_DELTA_PARAMETER],
+        request=None,
+        responses={status.HTTP_200_OK: CART_RESPONSE},
+    ),
+    select_all=extend_schema(
+        summary='Выбрать все товары в корзине или снять выбор',
+        parameters=[CART_DELTA_PARAMETER],
+        request=None,
+        responses={status.HTTP_200_OK: CART_RESPONSE},
+    ),
+    delete_all_selected=extend_schema(
+        summary='Удалить выбранные товары из корзины',
+        parameters=[CART_DELTA_PARAMETER],
+        responses={status.HTTP_200_OK: CART_RESPONSE},
+    ),
 )
-class ProductAPIView(CRUDAPIView):
+class ProductAPIView(CartResponseMixin, ConditionalGetMixin, CRUDAPIView):
     '''Товары.'''
 
     pagination_class = Pagination
@@ -243,36 +535,198 @@ class ProductAPIView(CRUDAPIView):
             return ProductRetrieveSerializer
         return ProductSerializer
 
+    def filter_by_favorited(self, queryset):
+        is_favorited = self.request.query_params.get('is_favorited')
+        if is_favorited == 'True' and self.request.user.is_authenticated:
+            queryset = queryset.filter(
+                product_favorite__user=self.request.user,
+            )
+        return queryset
+
+    def filter_by_category(self, queryset):
+        categories = self.request.query_params.getlist('category')
+        if categories:
+            try:
+                queryset = queryset.filter(
+                    reduce(
+                        or_,
+                        [
+                            Q(category__id=category)
+                            for category in categories
+                            if category.isdigit()
+                        ],
+                    ),
+                ).distinct()
+            except TypeError as error:
+                print(error)
+        return queryset
+
+    def filter_by_price(self, queryset):
+        price = self.request.query_params.getlist('price')
+        if price:
+            queryset = queryset.filter(
+                Q(price__gte=int(price[0])) & Q(price__lte=int(price[1])),
+            )
+        return queryset
+
     def get_queryset(self):
         queryset = Product.objects.all()
         if self.action in ('list', 'retrieve'):
-            is_favorited = self.request.query_params.get('is_favorited')
-            if is_favorited == 'True' and self.request.user.is_authenticated:
-                queryset = queryset.filter(
-                    product_favorite__user=self.request.user,
-                )
-            categories = self.request.query_params.getlist('category')
-            if categories:
-                try:
-                    queryset = queryset.filter(
-                        reduce(
-                            or_,
-                            [
-                                Q(category__id=category)
-                                for category in categories
-                                if category.isdigit()
-                            ],
-                        ),
-                    ).distinct()
-                except TypeError as error:
-                    print(error)
-            price = self.request.query_params.getlist('price')
-            if price:
-                queryset = queryset.filter(
-                    Q(price__gte=int(price[0])) & Q(price__lte=int(price[1])),
-                )
+            queryset = self.filter_by_favorited(queryset)
+            queryset = self.filter_by_category(queryset)
+            queryset = self.filter_by_price(queryset)
+            queryset = annotate_storefront(
+                queryset.select_related('rating_stats'),
+            ).prefetch_related(gallery_prefetch())
         return queryset
 
+    def get_etag_parts(self):
+        queryset = self.get_etag_queryset()
+        if queryset is None:
+            return None
+        self.stamp = queryset_stamp(
+            queryset,
+            'user__seller',
+            'rating_stats',
+            'images',
+            unbuilt_logos=Count(
+                'user__seller',
+                distinct=True,
+                filter=Q(user__seller__logo_derivatives={}),
+            ),
+        )
+        return (
+            self.stamp,
+            category_registry.get_version(self.request),
+            user_stamp(self.request.user),
+        )
+
+    def get_last_modified(self):
+        if self.action != 'retrieve' or self.request.user.is_authenticated:
+            return None
+        return max(
+            filter(
+                None,
+                (
+                    *self.stamp[1:-1:2],
+                    category_registry.get_last_modified(self.request),
+                ),
+            ),
+            default=None,
+        )
+
+    @staticmethod
+    def get_price_histogram(queryset, min_price, max_price, buckets):
+        span = max_price - min_price + 1
+        buckets = min(buckets, span)
+        counts = dict(
+            queryset.annotate(
+                bucket=ExpressionWrapper(
+                    (Cast('price', BigIntegerField()) - min_price)
+                    * buckets
+                    / span,
+                    output_field=BigIntegerField(),
+                ),
+            )
+            .values_list('bucket')
+            .annotate(count=Count('id'))
+            .order_by(),
+        )
+        return [
+            {
+                'from': min_price - (-bucket * span // buckets),
+                'to': min_price - (-(bucket + 1) * span // buckets) - 1,
+                'count': counts.get(bucket, 0),
+            }
+            for bucket in range(buckets)
+        ]
+
+    @action(detail=False, methods=['POST', 'PATCH'])
+    def bulk(self, request, *args, **kwargs):
+        '''Создание или изменение товаров списком.'''
+
+        if not isinstance(request.data, list) or not request.data:
+            return Response(
+                {'errors': 'Ожидается непустой список товаров.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(request.data) > PRODUCT_BULK_MAX_ITEMS:
+            return Response(
+                {
+                    'errors': (
+                        'За один запрос можно передать не больше '
+                        f'{PRODUCT_BULK_MAX_ITEMS} товаров.'
+                    ),
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not request.user.is_seller:
+            return Response(
+                {'errors': 'Вы не являетесь продавцом!'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        writer = ProductBulkWriter(request)
+        if request.method == 'POST':
+            response_status = writer.create(request.data)
+        else:
+            response_status = writer.update(request.data)
+        return Response({'results': writer.results}, status=response_status)
+
+    @action(detail=False, methods=['GET'])
+    def facets(self, request, *args, **kwargs):
+        '''Фасеты каталога для панели фильтров.'''
+
+        try:
+            buckets = int(
+                request.query_params.get('buckets', FACETS_PRICE_BUCKETS),
+            )
+        except ValueError:
+            buckets = FACETS_PRICE_BUCKETS
+        buckets = max(1, min(buckets, FACETS_MAX_PRICE_BUCKETS))
+        queryset = NameOrDescriptionFilter(
+            request.query_params,
+            queryset=self.filter_by_favorited(Product.objects.all()),
+            request=request,
+        ).qs.order_by()
+        categories = (
+            self.filter_by_price(queryset)
+            .values('category')
+            .annotate(count=Count('id'))
+            .order_by('category')
+        )
+        selected = {
+            int(category)
+            for category in request.query_params.getlist('category')
+            if category.isdigit()
+        }
+        queryset = self.filter_by_category(queryset)
+        prices = queryset.aggregate(min=Min('price'), max=Max('price'))
+        if prices['min'] is not None:
+            prices['histogram'] = self.get_price_histogram(
+                queryset,
+                prices['min'],
+                prices['max'],
+                buckets,
+            )
+        else:
+            prices['histogram'] = []
+        categories = [
+            {'id': row['category'], 'count': row['count']}
+            for row in categories
+        ]
+        return Response(
+            {
+                'count': sum(
+                    row['count']
+                    for row in categories
+                    if not selected or row['id'] in selected
+                ),
+                'categories': categories,
+                'price': prices,
+            },
+            status=status.HTTP_200_OK,
+        )
+
     @action(
         methods=['POST', 'DELETE', 'PATCH'],
         detail=True,
@@ -282,74 +736,103 @@ class ProductAPIView(CRUDAPIView):
         '''Добавление товара в корзину.'''
 
         product = get_object_or_404(Product, id=kwargs.get('pk'))
-        shopping_cart, created = ShoppingCart.objects.get_or_create(
-            owner=request.user,
-        )
-        context = {'request': request}
-        serializer = ShoppingCartSerializer(shopping_cart, context=context)
-        if request.method == 'POST':
-            cart_item, created = ShoppingCart_Items.objects.get_or_create(
-                cart=shopping_cart,
-                item=product,
-            )
-            if not created:
-                cart_item.quantity = F('quantity') + 1
-                cart_item.save()
-                return Response(
-                    serializer.data,
-                    status=status.HTTP_201_CREATED,
+        with transaction.atomic():
+            carts = ShoppingCart.objects.select_for_update()
+            shopping_cart, _ = carts.get_or_create(owner=request.user)
+            if request.method == 'POST':
+                price, after = add_to_cart(shopping_cart.pk, product.pk)
+                before = (
+                    (after[0] - 1, after[1]) if after[0] > 1 else EMPTY_LINE
+                )
+                shopping_cart.change_totals(
+                    **get_totals_delta(price, before, after),
                 )
-            else:
-                return Response(
-                    serializer.data,
-                    status=status.HTTP_201_CREATED,
+                return self.get_cart_response(
+                    shopping_cart,
+                    [(product.pk, price, after)],
+                    response_status=status.HTTP_201_CREATED,
                 )
 
-        if request.method == 'DELETE':
-            cart_item = get_object_or_404(
-                ShoppingCart_Items,
-                cart=shopping_cart,
-                item=product,
-            )
-            cart_item.delete()
-            if not ShoppingCart_Items.objects.filter(
-                cart=shopping_cart,
-            ).exists():
-                ShoppingCart.objects.get(owner=request.user).delete()
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            if request.method == 'DELETE':
+                cart_item = get_object_or_404(
+                    ShoppingCart_Items.objects.select_related('item'),
+                    cart=shopping_cart,
+                    item=product,
+                )
+                price = cart_item.item.price
+                cart_item.delete()
+                shopping_cart.change_totals(
+                    **get_totals_delta(
+                        price,
+                        (cart_item.quantity, cart_item.is_selected),
+                        EMPTY_LINE,
+                    ),
+                )
+                if not ShoppingCart_Items.objects.filter(
+                    cart=shopping_cart,
+                ).exists():
+                    ShoppingCart.objects.get(owner=request.user).delete()
+                return self.get_cart_response(
+                    shopping_cart,
+                    [(product.pk, price, EMPTY_LINE)],
+                )
 
-        if request.method == 'PATCH':
-            cart_item = get_object_or_404(
-                ShoppingCart_Items,
-                cart=shopping_cart,
-                item=product,
-            )
-            if cart_item.quantity > 1:
-                cart_item.quantity = F('quantity') - 1
-                cart_item.save()
-            else:
-                return Response(
-                    f'Нельзя удалить товар {product} данным способом.',
-                    status=status.HTTP_400_BAD_REQUEST,
+            if request.method == 'PATCH':
+                removed = remove_one_from_cart(shopping_cart.pk, product.pk)
+                if removed is None:
+                    get_object_or_404(
+                        ShoppingCart_Items,
+                        cart=shopping_cart,
+                        item=product,
+                    )
+                    return Response(
+                        f'Нельзя удалить товар {product} данным способом.',
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                price, after = removed
+                shopping_cart.change_totals(
+                    **get_totals_delta(
+                        price,
+                        (after[0] + 1, after[1]),
+                        after,
+                    ),
+                )
+                return self.get_cart_response(
+                    shopping_cart,
+                    [(product.pk, price, after)],
                 )
-            return Response(serializer.data, status=status.HTTP_200_OK)
 
     @action(methods=['PATCH'], detail=True, permission_classes=(IsOwner,))
     def select(self, request, *args, **kwargs):
         '''Выбор элемента в корзине.'''
 
         product = get_object_or_404(Product, id=kwargs.get('pk'))
-        shopping_cart, _ = ShoppingCart.objects.get_or_create(
-            owner=request.user,
-        )
-        context = {'request': request}
-        serializer = ShoppingCartSerializer(shopping_cart, context=context)
-        if request.method == 'PATCH':
-            ShoppingCart_Items.objects.filter(
-                item=product,
-                cart=shopping_cart,
-            ).update(is_selected=~F('is_selected'))
-            return Response(serializer.data, status=status.HTTP_200_OK)
+        with transaction.atomic():
+            shopping_cart = get_object_or_404(
+                ShoppingCart.objects.select_for_update(),
+                owner=request.user,
+            )
+            cart_item = (
+                ShoppingCart_Items.objects.select_related('item')
+                .filter(item=product, cart=shopping_cart)
+                .first()
+            )
+            if cart_item is None:
+                return self.get_cart_response(shopping_cart)
+            cart_item.is_selected = not cart_item.is_selected
+            cart_item.save(update_fields=('is_selected',))
+            after = (cart_item.quantity, cart_item.is_selected)
+            shopping_cart.change_totals(
+                **get_totals_delta(
+                    cart_item.item.price,
+                    (cart_item.quantity, not cart_item.is_selected),
+                    after,
+                ),
+            )
+            return self.get_cart_response(
+                shopping_cart,
+                [(product.pk, cart_item.item.price, after)],
+            )
 
     @action(
         methods=['PATCH', 'DELETE'],
@@ -359,37 +842,65 @@ class ProductAPIView(CRUDAPIView):
     def select_all(self, request, *args, **kwargs):
         '''Выбор всех элементов в корзине.'''
 
-        shopping_cart, created = ShoppingCart.objects.get_or_create(
-            owner=request.user,
-        )
-        context = {'request': request}
-        serializer = ShoppingCartSerializer(shopping_cart, context=context)
-        if request.method == 'PATCH':
-            ShoppingCart_Items.objects.filter(cart=shopping_cart).update(
-                is_selected=True,
+        is_selected = request.method == 'PATCH'
+        with transaction.atomic():
+            carts = ShoppingCart.objects.select_for_update()
+            shopping_cart, _ = carts.get_or_create(owner=request.user)
+            items = ShoppingCart_Items.objects.filter(
+                cart=shopping_cart,
+                is_selected=not is_selected,
             )
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        if request.method == 'DELETE':
-            ShoppingCart_Items.objects.filter(cart=shopping_cart).update(
-                is_selected=False,
+            lines = [
+                (item_id, price, (quantity, is_selected))
+                for item_id, quantity, price in items.values_list(
+                    'item_id',
+                    'quantity',
+                    'item__price',
+                )
+            ]
+            items.update(is_selected=is_selected)
+            quantity = sum(line[0] for _, _, line in lines)
+            cost = sum(price * line[0] for _, price, line in lines)
+            if not is_selected:
+                quantity, cost = -quantity, -cost
+            shopping_cart.change_totals(
+                selected_quantity=quantity,
+                selected_cost=cost,
             )
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return self.get_cart_response(shopping_cart, lines)
 
     @action(methods=['DELETE'], detail=False, permission_classes=(IsOwner,))
     def delete_all_selected(self, request, *args, **kwargs):
         '''Удаление всех выбранных элементов в корзине.'''
 
-        shopping_cart = ShoppingCart.objects.get(owner=request.user)
-        context = {'request': request}
-        serializer = ShoppingCartSerializer(shopping_cart, context=context)
-        ShoppingCart_Items.objects.filter(
-            cart=shopping_cart,
-            is_selected=True,
-        ).delete()
-        if not ShoppingCart_Items.objects.filter(cart=shopping_cart).exists():
-            shopping_cart.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        with transaction.atomic():
+            shopping_cart = ShoppingCart.objects.select_for_update().get(
+                owner=request.user,
+            )
+            items = ShoppingCart_Items.objects.filter(
+                cart=shopping_cart,
+                is_selected=True,
+            )
+            lines = (
+                [
+                    (item_id, None, EMPTY_LINE)
+                    for item_id in items.values_list('item_id', flat=True)
+                ]
+                if self.is_delta_response()
+                else []
+            )
+            items.delete()
+            shopping_cart.change_totals(
+                total_quantity=-shopping_cart.selected_quantity,
+                selected_quantity=-shopping_cart.selected_quantity,
+                selected_cost=-shopping_cart.selected_cost,
+            )
+            if not ShoppingCart_Items.objects.filter(
+                cart=shopping_cart,
+            ).exists():
+                shopping_cart.delete()
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            return self.get_cart_response(shopping_cart, lines)
 
 
 @extend_schema_view(
@@ -415,6 +926,61 @@ class ProductAPIView(CRUDAPIView):
         summary='Получить данные своего конкретного товара',
         description=('Возвращает данные своего конкретного товара.'),
     ),
+    export=extend_schema(
+        summary='Выгрузить свои товары',
+        description=(
+            'Отдаёт все свои товары файлом CSV или JSONL по мере чтения из '
+            'базы, без загрузки каталога в память.'
+        ),
+        parameters=[
+            OpenApiParameter(
+                name='file_format',
+                description='Формат файла: `csv` (по умолчанию) или `jsonl`.',
+                required=False,
+                type=str,
+            ),
+        ],
+        responses={
+            (status.HTTP_200_OK, 'text/csv'): OpenApiResponse(
+                description='Файл с товарами.',
+            ),
+        },
+    ),
+    import_products=extend_schema(
+        summary='Загрузить свои товары из файла',
+        description=(
+            'Принимает в поле `file` файл CSV или JSONL с полями `name`, '
+            '`description`, `price`, `category` и `video`. Строки с `id` '
+            'изменяют свои товары, остальные создают новые. Файл читается '
+            'построчно и записывается пакетами, после каждого пакета в '
+            'ответ приходит строка JSON с прогрессом: `processed`, '
+            '`created`, `updated`, `failed` и `errors` с номерами строк '
+            '`row` без учёта заголовка CSV. '
+            'Последняя строка содержит `done: true`.'
+        ),
+        parameters=[
+            OpenApiParameter(
+                name='file_format',
+                description=(
+                    'Формат файла: `csv` или `jsonl`. По умолчанию '
+                    'определяется по расширению.'
+                ),
+                required=False,
+                type=str,
+            ),
+        ],
+        request={
+            'multipart/form-data': {
+                'type': 'object',
+                'properties': {'file': {'type': 'string', 'format': 'binary'}},
+            },
+        },
+        responses={
+            (status.HTTP_200_OK, 'application/x-ndjson'): OpenApiResponse(
+                description='Прогресс загрузки построчно.',
+            ),
+        },
+    ),
 )
 class MyProductAPIView(ReadOnlyModelViewSet):
     '''Мои товары.'''
@@ -425,7 +991,80 @@ class MyProductAPIView(ReadOnlyModelViewSet):
     ordering_fields = ('created', 'price')
 
     def get_queryset(self):
-        return Product.objects.filter(user=self.request.user)
+        return (
+            Product.objects.filter(user=self.request.user)
+            .select_related('category')
+            .prefetch_related(gallery_prefetch())
+        )
+
+    @action(detail=False, methods=['GET'])
+    def export(self, request, *args, **kwargs):
+        '''Выгрузка своих товаров файлом.'''
+
+        file_format = request.query_params.get('file_format', CSV)
+        if file_format not in FILE_FORMATS:
+            return Response(
+                {'errors': 'Формат файла должен быть csv или jsonl.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        response = StreamingHttpResponse(
+            export_products(
+                Product.objects.filter(user=request.user),
+                file_format,
+            ),
+            content_type=CONTENT_TYPES[file_format],
+        )
+        response[
+            'Content-Disposition'
+        ] = f'attachment; filename="products.{file_format}"'
+        return response
+
+    @action(
+        detail=False,
+        methods=['POST'],
+        url_path='import',
+        parser_classes=(MultiPartParser,),
+    )
+    def import_products(self, request, *args, **kwargs):
+        '''Загрузка своих товаров из файла.'''
+
+        file = request.FILES.get('file')
+        if file is None:
+            return Response(
+                {'errors': 'Не передан файл.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        file_format = request.query_params.get(
+            'file_format',
+            file.name.rpartition('.')[2].lower(),
+        )
+        if file_format not in FILE_FORMATS:
+            return Response(
+                {'errors': 'Формат файла должен быть csv или jsonl.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if file.size > CATALOG_IMPORT_MAX_SIZE:
+            return Response(
+                {
+                    'errors': (
+                        'Размер файла не должен превышать '
+                        f'{CATALOG_IMPORT_MAX_SIZE} байт.'
+                    ),
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not request.user.is_seller:
+            return Response(
+                {'errors': 'Вы не являетесь продавцом!'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        progress = ProductImporter(request.user).run(
+            read_rows(file, file_format),
+        )
+        return StreamingHttpResponse(
+            (json.dumps(line, ensure_ascii=False) + '\n' for line in progress),
+            content_type=CONTENT_TYPES[JSONL],
+        )
 
 
 @extend_schema_view(
@@ -470,10 +1109,28 @@ class ReviewViewSet(ModelViewSet):
         product = get_object_or_404(Product, pk=product_id)
         return Review.objects.filter(product=product)
 
+    @transaction.atomic
     def perform_create(self, serializer):
         product_id = self.kwargs.get('product_id')
         product = get_object_or_404(Product, pk=product_id)
-        serializer.save(user=self.request.user, product=product)
+        review = serializer.save(user=self.request.user, product=product)
+        update_rating_stats(product.id, added=review.rating)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_rating = serializer.instance.rating
+        review = serializer.save()
+        if review.rating != old_rating:
+            update_rating_stats(
+                review.product_id,
+                added=review.rating,
+                removed=old_rating,
+            )
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        update_rating_stats(instance.product_id, removed=instance.rating)
 
 
 @extend_schema_view(
@@ -505,7 +1162,7 @@ class ReviewViewSet(ModelViewSet):
         description=('Удаляет заказ.'),
     ),
 )
-class OrderViewSet(OrderAPIView):
+class OrderViewSet(ConditionalGetMixin, OrderAPIView):
     '''Заказы покупателя.'''
 
     serializer_class = OrderSerializer
@@ -520,6 +1177,16 @@ class OrderViewSet(OrderAPIView):
     def get_queryset(self):
         return Order.objects.filter(user=self.request.user)
 
+    def get_etag_parts(self):
+        queryset = self.get_etag_queryset()
+        if queryset is None:
+            return None
+        return (
+            queryset_stamp(queryset, 'product_list'),
+            category_registry.get_version(self.request),
+            user_stamp(self.request.user),
+        )
+
     def get_serializer_context(self):
         return {'request': self.request}
 
@@ -556,6 +1223,17 @@ class OrderViewSet(OrderAPIView):
         'Возвращает минимальную и максимальную стоимость бота. Если данных '
         'нет, то возвращает `null`.'
     ),
+    parameters=[
+        OpenApiParameter(
+            name='category',
+            description=(
+                'Стоимость только в указанных категориях. Передаём `id` '
+                'категории, параметр можно повторять.'
+            ),
+            required=False,
+            type=int,
+        ),
+    ],
     responses={
         status.HTTP_200_OK: OpenApiResponse(
             response={'example': {'price__min': 500, 'price__max': 1000}},
@@ -565,7 +1243,12 @@ class OrderViewSet(OrderAPIView):
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_min_max_cost(request):
+    categories = [
+        int(category)
+        for category in request.query_params.getlist('category')
+        if category.isdigit()
+    ]
     return Response(
-        Product.objects.all().aggregate(Min('price'), Max('price')),
+        get_price_range(categories),
         status=status.HTTP_200_OK,
     )
@@ -22,6 +22,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'api.apps.ApiConfig',
     'core.apps.CoreConfig',
@@ -94,6 +95,18 @@ else:
         },
     }
 
+CACHE_BACKEND = config(
+    'CACHE_BACKEND',
+    default='django.core.cache.backends.locmem.LocMemCache',
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    },
+}
+
 if DEBUG:
     INSTALLED_APPS += ['debug_toolbar']
     MIDDLEWARE += ['debug_toolbar.middleware.DebugToolbarMiddleware']
@@ -176,6 +189,80 @@ DJOSER = {
 
 PAGE_SIZE = 9
 
+# LocMemCache у каждого процесса свой: после изменения цен кэш обновляет
+# только процесс, обработавший запрос, а остальные отдают старый диапазон
+# до истечения срока. Поэтому без общего кэша (Redis, Memcached) срок
+# короткий.
+PRICE_RANGES_CACHE_TIMEOUT = config(
+    'PRICE_RANGES_CACHE_TIMEOUT',
+    default=60 if CACHE_BACKEND.endswith('.LocMemCache') else 60 * 60,
+    cast=int,
+)
+
+PRODUCT_BULK_MAX_ITEMS = 5000
+
+PRODUCT_BULK_BATCH_SIZE = 500
+
+CART_BATCH_MAX_OPERATIONS = 200
+
+CATALOG_EXPORT_CHUNK_SIZE = 2000
+
+CATALOG_IMPORT_BATCH_SIZE = 500
+
+CATALOG_IMPORT_MAX_SIZE = config(
+    'CATALOG_IMPORT_MAX_SIZE',
+    default=50 * 1024 * 1024,
+    cast=int,
+)
+
+FACETS_PRICE_BUCKETS = 10
+
+FACETS_MAX_PRICE_BUCKETS = 50
+
+SEARCH_TRIGRAM_THRESHOLD = config(
+    'SEARCH_TRIGRAM_THRESHOLD',
+    default=0.3,
+    cast=float,
+)
+
+SEARCH_TRIGRAM_MIN_RESULTS = config(
+    'SEARCH_TRIGRAM_MIN_RESULTS',
+    default=3,
+    cast=int,
+)
+
+SEARCH_TRIGRAM_LIMIT = 50
+
+SEARCH_TRIGRAM_TIMEOUT = config(
+    'SEARCH_TRIGRAM_TIMEOUT',
+    default=0.2,
+    cast=float,
+)
+
+SEARCH_TRIGRAM_BACKGROUND_REBUILD = config(
+    'SEARCH_TRIGRAM_BACKGROUND_REBUILD',
+    default=True,
+    cast=bool,
+)
+
+MAX_IMAGE_UPLOAD_SIZE = config(
+    'MAX_IMAGE_UPLOAD_SIZE',
+    default=5 * 1024 * 1024,
+    cast=int,
+)
+
+BASE64_DECODE_CHUNK_SIZE = 64 * 1024
+
+IMAGE_DERIVATIVE_WIDTHS = (320, 640, 1280)
+
+IMAGE_DERIVATIVE_QUALITY = 80
+
+IMAGE_DERIVATIVE_WORKERS = config(
+    'IMAGE_DERIVATIVE_WORKERS',
+    default=2,
+    cast=int,
+)
+
 FIRST_ARTICLE = 100000
 
 FIRST_ORDER_NUMBER = 100000
@@ -0,0 +1,233 @@
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from products.models import Product, ShoppingCart, ShoppingCart_Items
+
+TOTALS_FIELDS = ('total_quantity', 'selected_quantity', 'selected_cost')
+EMPTY_LINE = (0, False)
+MAX_LINE_QUANTITY = 32767
+
+SET_QUANTITY = 'set'
+ADD = 'add'
+REMOVE = 'remove'
+SELECT = 'select'
+DESELECT = 'deselect'
+CART_OPERATIONS = (SET_QUANTITY, ADD, REMOVE, SELECT, DESELECT)
+
+
+def get_totals_delta(price, before, after):
+    '''Изменение итогов корзины при смене строки `before` на `after`.
+
+    Строка задаётся парой `(кол-во, выбрана ли)`, отсутствующая строка -
+    `EMPTY_LINE`.
+    '''
+
+    selected = after[0] * after[1] - before[0] * before[1]
+    return {
+        'total_quantity': after[0] - before[0],
+        'selected_quantity': selected,
+        'selected_cost': selected * price,
+    }
+
+
+def get_line_sql():
+    quote_name = connection.ops.quote_name
+    return {
+        'table': quote_name(ShoppingCart_Items._meta.db_table),
+        'cart': quote_name(ShoppingCart_Items._meta.get_field('cart').column),
+        'item': quote_name(ShoppingCart_Items._meta.get_field('item').column),
+        'product': quote_name(Product._meta.db_table),
+        'product_pk': quote_name(Product._meta.pk.column),
+        'price': quote_name(Product._meta.get_field('price').column),
+    }
+
+
+PRICE_SQL = (
+    '(SELECT {product}.{price} FROM {product} '
+    'WHERE {product}.{product_pk} = {table}.{item})'
+)
+
+
+def add_to_cart(cart_id, item_id, quantity=1):
+    '''Добавляет `quantity` штук товара в корзину одним запросом.
+
+    Строка создаётся или её кол-во увеличивается через
+    `INSERT ... ON CONFLICT DO UPDATE` по ограничению `unique_cart_item`.
+    Возвращает цену товара, прочитанную тем же запросом, и строку после
+    изменения парой `(кол-во, выбрана ли)`.
+    '''
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            (
+                'INSERT INTO {table} ({cart}, {item}, quantity, is_selected) '
+                'VALUES (%s, %s, %s, %s) '
+                'ON CONFLICT ({cart}, {item}) DO UPDATE '
+                'SET quantity = {table}.quantity + EXCLUDED.quantity '
+                f'RETURNING {PRICE_SQL}, quantity, is_selected'
+            ).format(**get_line_sql()),
+            [cart_id, item_id, quantity, True],
+        )
+        price, quantity, is_selected = cursor.fetchone()
+    return price, (quantity, bool(is_selected))
+
+
+def remove_one_from_cart(cart_id, item_id):
+    '''Уменьшает кол-во товара в корзине на единицу одним запросом.
+
+    Строка с одной штукой не меняется. Возвращает цену товара,
+    прочитанную тем же запросом, и строку после изменения парой
+    `(кол-во, выбрана ли)` или `None`, если строка не изменилась.
+    '''
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            (
+                'UPDATE {table} SET quantity = quantity - 1 '
+                'WHERE {cart} = %s AND {item} = %s AND quantity > 1 '
+                f'RETURNING {PRICE_SQL}, quantity, is_selected'
+            ).format(**get_line_sql()),
+            [cart_id, item_id],
+        )
+        row = cursor.fetchone()
+    return row and (row[0], (row[1], bool(row[2])))
+
+
+def apply_operation(line, operation):
+    '''Строка корзины `(кол-во, выбрана ли)` после операции.'''
+
+    quantity, is_selected = line
+    name = operation['operation']
+    count = operation.get('quantity', 1)
+    if name in (SET_QUANTITY, ADD):
+        if not quantity:
+            is_selected = True
+        if name == ADD:
+            count = min(quantity + count, MAX_LINE_QUANTITY)
+        quantity = count
+    elif name == REMOVE:
+        quantity = max(quantity - count, 0) if 'quantity' in operation else 0
+    elif quantity:
+        is_selected = name == SELECT
+    return (quantity, is_selected) if quantity else EMPTY_LINE
+
+
+def apply_cart_operations(cart, operations, prices):
+    '''Применяет операции к строкам корзины пакетными запросами.
+
+    Операции применяются по порядку к строкам в памяти, затем удалённые
+    строки удаляются, изменённые и новые записываются `bulk_update` и
+    `bulk_create`, а итоги корзины сдвигаются одним запросом. Корзина
+    должна быть заблокирована в текущей транзакции. `prices` - цены
+    товаров из операций по их `id`. Возвращает изменённые строки тройками
+    `(id товара, цена, (кол-во, выбрана ли))`.
+    '''
+
+    lines = {
+        line.item_id: line
+        for line in ShoppingCart_Items.objects.filter(
+            cart=cart,
+            item__in=prices,
+        )
+    }
+    before = {
+        item_id: (line.quantity, line.is_selected)
+        for item_id, line in lines.items()
+    }
+    after = dict(before)
+    for operation in operations:
+        item_id = operation['product']
+        after[item_id] = apply_operation(
+            after.get(item_id, EMPTY_LINE),
+            operation,
+        )
+    created, changed, removed, result = [], [], [], []
+    totals = dict.fromkeys(TOTALS_FIELDS, 0)
+    for item_id, line in after.items():
+        old_line = before.get(item_id, EMPTY_LINE)
+        if line == old_line:
+            continue
+        result.append((item_id, prices[item_id], line))
+        delta = get_totals_delta(prices[item_id], old_line, line)
+        for field, value in delta.items():
+            totals[field] += value
+        if line == EMPTY_LINE:
+            removed.append(lines[item_id].pk)
+        elif item_id in lines:
+            lines[item_id].quantity, lines[item_id].is_selected = line
+            changed.append(lines[item_id])
+        else:
+            created.append(
+                ShoppingCart_Items(
+                    cart=cart,
+                    item_id=item_id,
+                    quantity=line[0],
+                    is_selected=line[1],
+                ),
+            )
+    if removed:
+        ShoppingCart_Items.objects.filter(pk__in=removed).delete()
+    ShoppingCart_Items.objects.bulk_update(
+        changed,
+        ('quantity', 'is_selected'),
+    )
+    ShoppingCart_Items.objects.bulk_create(created)
+    cart.change_totals(**totals)
+    return result
+
+
+def calculate_totals():
+    '''Итоги корзины, посчитанные по её строкам, для `annotate`/`update`.'''
+
+    lines = (
+        ShoppingCart_Items.objects.filter(cart=OuterRef('pk'))
+        .order_by()
+        .values('cart')
+    )
+
+    def total(expression, **filters):
+        return Coalesce(
+            Subquery(
+                lines.filter(**filters)
+                .annotate(total=Sum(expression))
+                .values('total'),
+            ),
+            0,
+        )
+
+    return {
+        'total_quantity': total('quantity'),
+        'selected_quantity': total('quantity', is_selected=True),
+        'selected_cost': total(
+            F('quantity') * F('item__price'),
+            is_selected=True,
+        ),
+    }
+
+
+def recalculate_cart_totals(queryset):
+    '''Пересчитывает итоги корзин выборки по их строкам одним запросом.'''
+
+    return queryset.update(
+        **calculate_totals(),
+        version=F('version') + 1,
+        modified=timezone.now(),
+    )
+
+
+def get_drifted_carts():
+    '''Корзины, сохранённые итоги которых разошлись со строками.'''
+
+    calculated = {
+        f'calculated_{field}': expression
+        for field, expression in calculate_totals().items()
+    }
+    return (
+        ShoppingCart.objects.annotate(**calculated)
+        .exclude(
+            **{field: F(f'calculated_{field}') for field in TOTALS_FIELDS},
+        )
+        .order_by('pk')
+    )
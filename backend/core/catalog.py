@@ -0,0 +1,205 @@
+import csv
+import json
+from io import TextIOWrapper
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from core.carts import recalculate_cart_totals
+from core.prices import refresh_price_ranges
+from core.sequences import PRODUCT_ARTICLE, reserve
+from products.models import Category, Product, ShoppingCart
+
+CSV = 'csv'
+JSONL = 'jsonl'
+FILE_FORMATS = (CSV, JSONL)
+CONTENT_TYPES = {CSV: 'text/csv', JSONL: 'application/x-ndjson'}
+
+EXPORT_FIELDS = (
+    'id',
+    'article',
+    'name',
+    'description',
+    'price',
+    'category',
+    'video',
+    'created',
+    'modified',
+)
+IMPORT_FIELDS = ('name', 'description', 'price', 'category', 'video')
+
+
+class Echo:
+    '''Буфер для `csv.writer`, который сразу отдаёт записанную строку.'''
+
+    def write(self, value):
+        return value
+
+
+def export_products(queryset, file_format):
+    '''Построчная выгрузка товаров в CSV или JSONL.
+
+    Товары читаются через `iterator`, на PostgreSQL - серверным курсором,
+    поэтому расход памяти не зависит от размера каталога.
+    '''
+
+    rows = (
+        queryset.order_by('id')
+        .values_list(*EXPORT_FIELDS)
+        .iterator(
+            chunk_size=settings.CATALOG_EXPORT_CHUNK_SIZE,
+        )
+    )
+    if file_format == CSV:
+        writer = csv.writer(Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            yield writer.writerow(row)
+        return
+    for row in rows:
+        yield (
+            json.dumps(
+                dict(zip(EXPORT_FIELDS, row)),
+                ensure_ascii=False,
+                default=str,
+            )
+            + '\n'
+        )
+
+
+def read_rows(file, file_format):
+    '''Строки загруженного файла по одной, без чтения файла целиком.'''
+
+    lines = TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    if file_format == CSV:
+        yield from csv.DictReader(lines)
+        return
+    for line in lines:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+class ProductImporter:
+    '''Загрузка каталога продавца из CSV или JSONL.
+
+    Строки с `id` изменяют товары продавца, остальные создают новые.
+    Каждая строка проверяется валидаторами полей `Product`, а запись идёт
+    пакетами по `CATALOG_IMPORT_BATCH_SIZE` строк, каждый пакет - в своей
+    транзакции. После каждого пакета генератор `run` отдаёт прогресс.
+    '''
+
+    batch_size = settings.CATALOG_IMPORT_BATCH_SIZE
+
+    def __init__(self, user):
+        self.user = user
+        self.processed = self.created = self.updated = self.failed = 0
+
+    def run(self, rows):
+        rows = enumerate(rows, start=1)
+        result = {'done': True}
+        while True:
+            try:
+                batch = list(islice(rows, self.batch_size))
+            except (UnicodeDecodeError, csv.Error) as error:
+                result['error'] = f'Не удалось прочитать файл: {error}'
+                batch = []
+            if not batch:
+                break
+            yield self.get_progress(self.import_batch(batch))
+        if self.created or self.updated:
+            refresh_price_ranges()
+        yield dict(self.get_progress([]), **result)
+
+    def get_progress(self, errors):
+        return {
+            'processed': self.processed,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': errors,
+        }
+
+    def import_batch(self, batch):
+        existing = Product.objects.filter(
+            user=self.user,
+            pk__in=[
+                row['id']
+                for _, row in batch
+                if isinstance(row, dict) and str(row.get('id', '')).isdigit()
+            ],
+        ).in_bulk()
+        category_ids = set(Category.objects.values_list('pk', flat=True))
+        created, updated, errors = [], [], []
+        for number, row in batch:
+            try:
+                product = self.build(row, existing, category_ids)
+            except ValidationError as error:
+                errors.append({'row': number, 'errors': error.message_dict})
+                continue
+            (updated if product.pk else created).append(product)
+        now = timezone.now()
+        for product in updated:
+            product.modified = now
+        with transaction.atomic():
+            if created:
+                articles = reserve(PRODUCT_ARTICLE, len(created))
+                for product, article in zip(created, articles):
+                    product.article = article
+                Product.objects.bulk_create(created)
+            Product.objects.bulk_update(
+                updated,
+                IMPORT_FIELDS[:3] + ('category_id', 'video', 'modified'),
+            )
+            if updated:
+                recalculate_cart_totals(
+                    ShoppingCart.objects.filter(items__in=updated),
+                )
+        self.processed += len(batch)
+        self.created += len(created)
+        self.updated += len(updated)
+        self.failed += len(errors)
+        return errors
+
+    def build(self, row, existing, category_ids):
+        product = self.get_product(row, existing)
+        errors = {}
+        for field in IMPORT_FIELDS:
+            if field not in row:
+                continue
+            value = None if row[field] == '' else row[field]
+            if field != 'category':
+                setattr(product, field, value)
+            elif str(value).isdigit() and int(value) in category_ids:
+                product.category_id = int(value)
+            else:
+                errors['category'] = [
+                    f'Категория с id={value} не существует.',
+                ]
+        if product.category_id is None and 'category' not in errors:
+            errors['category'] = ['Обязательное поле.']
+        try:
+            product.clean_fields(exclude=('user', 'article', 'category'))
+        except ValidationError as error:
+            errors.update(error.message_dict)
+        if errors:
+            raise ValidationError(errors)
+        return product
+
+    def get_product(self, row, existing):
+        if not isinstance(row, dict):
+            raise ValidationError(
+                {'__all__': ['Строка должна быть объектом JSON.']},
+            )
+        product_id = str(row.get('id') or '')
+        if not product_id:
+            return Product(user=self.user, article=None)
+        product = product_id.isdigit() and existing.get(int(product_id))
+        if not product:
+            raise ValidationError({'id': ['Товар не найден.']})
+        return product
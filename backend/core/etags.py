@@ -0,0 +1,77 @@
+from hashlib import md5
+
+from django.db.models import Count, F, Max
+from django.db.models.functions import Coalesce
+from django.utils.cache import quote_etag
+
+from products.models import Favorite, Order, ShoppingCart
+
+
+def make_etag(*parts):
+    return quote_etag(md5(repr(parts).encode()).hexdigest())
+
+
+def get_modified(model, prefix=''):
+    '''Время изменения записи: `modified`, а если его нет - `created`.'''
+
+    fields = [
+        f'{prefix}{name}'
+        for name in ('modified', 'created')
+        if any(field.name == name for field in model._meta.get_fields())
+    ]
+    return Coalesce(*fields) if len(fields) > 1 else F(fields[0])
+
+
+def queryset_stamp(queryset, *related, **extra):
+    '''Кол-во записей и время последнего изменения записей выборки.
+
+    Для связанных моделей из `related` добавляются их кол-во и время
+    последнего изменения, в конце - значения агрегатов из `extra`.
+    '''
+
+    aggregates = {
+        'count': Count('id', distinct=True),
+        'modified': Max(get_modified(queryset.model)),
+    }
+    for name in related:
+        model = queryset.model
+        for part in name.split('__'):
+            model = model._meta.get_field(part).related_model
+        aggregates[f'{name}_count'] = Count(name, distinct=True)
+        aggregates[f'{name}_modified'] = Max(
+            get_modified(model, f'{name}__'),
+        )
+    aggregates.update(extra)
+    return tuple(queryset.order_by().aggregate(**aggregates).values())
+
+
+def cart_stamp(user):
+    return tuple(
+        ShoppingCart.objects.filter(owner=user).values_list(
+            'id',
+            'version',
+        ),
+    )
+
+
+def user_stamp(user):
+    '''Отпечаток данных пользователя, от которых зависят признаки товаров.
+
+    Признаки «в избранном», «в корзине» и «куплен» отличаются у разных
+    пользователей, поэтому входят в `ETag` всех ответов с товарами.
+    '''
+
+    if user.is_anonymous:
+        return None
+    favorites = Favorite.objects.filter(user=user).aggregate(
+        count=Count('id'),
+        last=Max('id'),
+    )
+    paid = Order.objects.filter(user=user, is_paid=True).count()
+    return (
+        user.id,
+        favorites['count'],
+        favorites['last'],
+        cart_stamp(user),
+        paid,
+    )
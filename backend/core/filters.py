@@ -1,6 +1,6 @@
 import django_filters
-from django.db.models import Q
 
+from core.search import search_products
 from products.models import Product
 
 
@@ -10,8 +10,10 @@ class NameOrDescriptionFilter(django_filters.FilterSet):
     search = django_filters.CharFilter(method='custom_filter')
 
     def custom_filter(self, queryset, name, value):
-        return queryset.filter(
-            Q(name__icontains=value) | Q(description__icontains=value),
+        return search_products(
+            queryset,
+            value,
+            ranked=not self.request.query_params.get('ordering'),
         )
 
     class Meta:
@@ -0,0 +1,281 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image as PillowImage
+from PIL import ImageOps
+
+from products.models import Image, ImageProduct
+from products.utils import get_file_hash
+
+logger = logging.getLogger(__name__)
+
+executor = (
+    ThreadPoolExecutor(
+        max_workers=settings.IMAGE_DERIVATIVE_WORKERS,
+        thread_name_prefix='image-derivatives',
+    )
+    if settings.IMAGE_DERIVATIVE_WORKERS
+    else None
+)
+
+
+def get_image_name(instance, field_name):
+    '''Имя файла в поле без обращения к базе для отложенных полей.'''
+
+    value = instance.__dict__.get(field_name)
+    return getattr(value, 'name', value) or ''
+
+
+def save_variant(storage, image, name, image_format):
+    if image_format == 'jpeg' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA')
+    buffer = BytesIO()
+    image.save(
+        buffer,
+        format=image_format,
+        quality=settings.IMAGE_DERIVATIVE_QUALITY,
+        optimize=True,
+    )
+    return storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def render_derivatives(field_file):
+    '''Уменьшенные копии изображения в исходном формате и в WebP.
+
+    Копии нужной ширины сохраняются рядом с оригиналом без метаданных,
+    самая большая из них - в размер оригинала. Возвращает
+    `{формат: {ширина: имя файла}}`.
+    '''
+
+    storage = field_file.storage
+    root = str(PurePosixPath(field_file.name).with_suffix(''))
+    with field_file.open('rb'), PillowImage.open(field_file) as source:
+        image_format = 'jpeg' if source.format == 'JPEG' else 'png'
+        source = ImageOps.exif_transpose(source)
+        widths = [
+            width
+            for width in settings.IMAGE_DERIVATIVE_WIDTHS
+            if width < source.width
+        ] + [source.width]
+        derivatives = {image_format: {}, 'webp': {}}
+        for width in widths:
+            height = max(1, round(source.height * width / source.width))
+            resized = source.resize((width, height), PillowImage.LANCZOS)
+            for variant_format, variants in derivatives.items():
+                extension = (
+                    'jpg' if variant_format == 'jpeg' else variant_format
+                )
+                variants[str(width)] = save_variant(
+                    storage,
+                    resized,
+                    f'{root}_{width}w.{extension}',
+                    variant_format,
+                )
+    return derivatives
+
+
+def delete_derivatives(derivatives):
+    for variants in derivatives.values():
+        for name in variants.values():
+            default_storage.delete(name)
+
+
+def build_derivatives(model, pk, field_name):
+    '''Строит копии изображения из поля `field_name` записи `pk`.
+
+    Результат записывается, только если за время работы файл в поле не
+    сменился, иначе построенные копии удаляются. Копии общие для всех
+    записей с тем же файлом. Время изменения обновляется только у записей
+    `Image` - у пользователей и магазинов это время их собственных правок.
+    '''
+
+    derivatives_field = f'{field_name}_derivatives'
+    instance = (
+        model.objects.filter(pk=pk).only(field_name, derivatives_field).first()
+    )
+    if instance is None:
+        return
+    field_file = getattr(instance, field_name)
+    if field_file:
+        derivatives = render_derivatives(field_file)
+        queryset = model.objects.filter(**{field_name: field_file.name})
+    else:
+        derivatives = {}
+        queryset = model.objects.filter(
+            Q(**{f'{field_name}__isnull': True}) | Q(**{field_name: ''}),
+            pk=pk,
+        )
+    with transaction.atomic():
+        pks = list(queryset.select_for_update().values_list('pk', flat=True))
+        fields = {derivatives_field: derivatives}
+        if model is Image:
+            fields['modified'] = timezone.now()
+        queryset.filter(pk__in=pks).update(**fields)
+    if not pks:
+        delete_derivatives(derivatives)
+        return
+    delete_derivatives(getattr(instance, derivatives_field))
+
+
+def run_build_derivatives(model, pk, field_name):
+    try:
+        build_derivatives(model, pk, field_name)
+    except Exception:
+        logger.exception(
+            'Не удалось построить копии %s.%s для записи %s',
+            model.__name__,
+            field_name,
+            pk,
+        )
+    finally:
+        if executor is not None:
+            connection.close()
+
+
+def schedule_derivatives(model, pk, field_name):
+    '''Ставит построение копий в фоновый пул после фиксации транзакции.
+
+    При `IMAGE_DERIVATIVE_WORKERS = 0` копии строятся сразу после
+    фиксации в том же потоке.
+    '''
+
+    def submit():
+        if executor is None:
+            run_build_derivatives(model, pk, field_name)
+        else:
+            executor.submit(run_build_derivatives, model, pk, field_name)
+
+    transaction.on_commit(submit)
+
+
+def get_srcset(derivatives, request=None):
+    '''Копии изображения в виде `{формат: srcset}`.'''
+
+    if not derivatives:
+        return None
+    srcset = {}
+    for image_format, variants in derivatives.items():
+        candidates = []
+        for width, name in sorted(variants.items(), key=lambda x: int(x[0])):
+            url = default_storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            candidates.append(f'{url} {width}w')
+        srcset[image_format] = ', '.join(candidates)
+    return srcset
+
+
+def store_image(user, file):
+    '''Изображение пользователя с содержимым файла `file`.
+
+    Файлы хранятся по хешу содержимого. Если у пользователя уже есть
+    изображение с таким содержимым, возвращается оно, а если такой файл
+    уже загружал кто-то другой - создаётся запись на тот же файл и копии.
+    Запись с этим файлом блокируется до фиксации новой: удаление записи
+    ждёт блокировку, а если запись уже удалена, файл загружается заново.
+    '''
+
+    content_hash = get_file_hash(file)
+    image = Image.objects.filter(user=user, content_hash=content_hash).first()
+    if image is not None:
+        return image
+    try:
+        with transaction.atomic():
+            stored = (
+                Image.objects.select_for_update()
+                .filter(content_hash=content_hash)
+                .exclude(image='')
+                .values('image', 'image_derivatives')
+                .first()
+            )
+            if stored is not None:
+                return Image.objects.create(
+                    user=user,
+                    content_hash=content_hash,
+                    **stored,
+                )
+            return Image.objects.create(
+                user=user,
+                content_hash=content_hash,
+                image=file,
+            )
+    except IntegrityError:
+        return Image.objects.get(user=user, content_hash=content_hash)
+
+
+def release_images(image_ids):
+    '''Удаляет изображения, которые больше не используются.
+
+    Изображение используется, пока на него ссылается товар или категория.
+    '''
+
+    Image.objects.filter(
+        pk__in=image_ids,
+        imageproduct__isnull=True,
+        category__isnull=True,
+    ).delete()
+
+
+def delete_unused_file(name, derivatives):
+    '''Удаляет файл и его копии, если на файл не ссылается ни одна запись.
+
+    Вызывается после фиксации удаления записи. Новую ссылку на файл
+    `store_image` создаёт только под блокировкой существующей записи с
+    этим файлом, поэтому после проверки ссылок файл никто не займёт.
+    '''
+
+    if name and not Image.objects.filter(image=name).exists():
+        default_storage.delete(name)
+        delete_derivatives(derivatives)
+
+
+def save_gallery(product, images):
+    '''Приводит галерею товара к списку `images`.
+
+    Элемент списка - `id` уже загруженного изображения или новый файл.
+    Сохранившиеся связи остаются на месте, у сдвинутых меняется позиция,
+    а лишние удаляются и недостающие создаются пакетно.
+    '''
+
+    image_ids = [
+        image
+        if isinstance(image, int)
+        else store_image(product.user, image).pk
+        for image in images
+    ]
+    links = {}
+    for link in ImageProduct.objects.filter(product=product).order_by(
+        'position',
+        'id',
+    ):
+        links.setdefault(link.image_id, []).append(link)
+    created, moved = [], []
+    for position, image_id in enumerate(image_ids):
+        if links.get(image_id):
+            link = links[image_id].pop(0)
+            if link.position != position:
+                link.position = position
+                moved.append(link)
+        else:
+            created.append(
+                ImageProduct(
+                    product=product,
+                    image_id=image_id,
+                    position=position,
+                ),
+            )
+    removed = [link.pk for rest in links.values() for link in rest]
+    if removed:
+        ImageProduct.objects.filter(pk__in=removed).delete()
+    ImageProduct.objects.bulk_update(moved, ['position'])
+    ImageProduct.objects.bulk_create(created)
@@ -0,0 +1,63 @@
+from products.models import Favorite, OrderProductList, ShoppingCart_Items
+
+FAVORITED = 'favorited'
+IN_SHOPPING_CART = 'in_shopping_cart'
+BUYING = 'buying'
+FLAGS = (FAVORITED, IN_SHOPPING_CART, BUYING)
+
+
+class ProductFlagsLoader:
+    '''Пакетная загрузка признаков товаров для текущего пользователя.
+
+    Живёт в рамках одного запроса. Сериализатор списка заранее сообщает
+    загрузчику `id` товаров страницы, и при первом обращении к признаку
+    он запрашивается одним запросом сразу для всех этих товаров.
+    '''
+
+    def __init__(self, user):
+        self.user = user
+        self._pending = set()
+        self._loaded = {flag: set() for flag in FLAGS}
+        self._values = {flag: set() for flag in FLAGS}
+
+    def prime(self, product_ids):
+        self._pending.update(product_ids)
+
+    def load(self, flag, product_id):
+        if self.user.is_anonymous:
+            return False
+        loaded = self._loaded[flag]
+        if product_id not in loaded:
+            product_ids = (self._pending | {product_id}) - loaded
+            self._values[flag].update(self._fetch(flag, product_ids))
+            loaded.update(product_ids)
+        return product_id in self._values[flag]
+
+    def _fetch(self, flag, product_ids):
+        if flag == FAVORITED:
+            queryset = Favorite.objects.filter(
+                user=self.user,
+                product__in=product_ids,
+            ).values_list('product', flat=True)
+        elif flag == IN_SHOPPING_CART:
+            queryset = ShoppingCart_Items.objects.filter(
+                cart__owner=self.user,
+                item__in=product_ids,
+            ).values_list('item', flat=True)
+        else:
+            queryset = OrderProductList.objects.filter(
+                order__user=self.user,
+                order__is_paid=True,
+                product__in=product_ids,
+            ).values_list('product', flat=True)
+        return set(queryset)
+
+
+def get_product_flags_loader(request):
+    if not hasattr(request, '_product_flags_loader'):
+        request._product_flags_loader = ProductFlagsLoader(request.user)
+    return request._product_flags_loader
+
+
+def load_product_flag(request, flag, product_id):
+    return get_product_flags_loader(request).load(flag, product_id)
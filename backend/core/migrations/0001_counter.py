@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+SEQUENCES = ("product_article", "order_number")
+
+
+def get_last_value(model, field, first):
+    return model.objects.aggregate(value=Max(field))["value"] or first - 1
+
+
+def start_sequences(apps, schema_editor):
+    Counter = apps.get_model("core", "Counter")
+    Product = apps.get_model("products", "Product")
+    Order = apps.get_model("products", "Order")
+    last_values = {
+        "product_article": get_last_value(
+            Product, "article", settings.FIRST_ARTICLE
+        ),
+        "order_number": get_last_value(
+            Order, "number_order", settings.FIRST_ORDER_NUMBER
+        ),
+    }
+    for name, value in last_values.items():
+        if schema_editor.connection.vendor == "postgresql":
+            schema_editor.execute(f"CREATE SEQUENCE IF NOT EXISTS {name}_seq")
+            schema_editor.execute(
+                "SELECT setval(%s, %s)", [f"{name}_seq", value]
+            )
+        else:
+            Counter.objects.update_or_create(
+                name=name, defaults={"value": value}
+            )
+
+
+def drop_sequences(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        for name in SEQUENCES:
+            schema_editor.execute(f"DROP SEQUENCE IF EXISTS {name}_seq")
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = [
+        ("products", "0036_imageproduct_position"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Counter",
+            fields=[
+                (
+                    "name",
+                    models.CharField(
+                        max_length=50,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="название",
+                    ),
+                ),
+                (
+                    "value",
+                    models.PositiveBigIntegerField(
+                        default=0, verbose_name="последнее значение"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "счётчик",
+                "verbose_name_plural": "счётчики",
+            },
+        ),
+        migrations.RunPython(start_sequences, drop_sequences),
+    ]
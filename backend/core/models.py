@@ -18,3 +18,17 @@ class TimestampedModel(DefaultModel, Timestamped):
     class Meta:
         abstract = True
         ordering = ('-created',)
+
+
+class Counter(models.Model):
+    '''Счётчик номеров для баз без последовательностей.'''
+
+    name = models.CharField('название', max_length=50, primary_key=True)
+    value = models.PositiveBigIntegerField('последнее значение', default=0)
+
+    class Meta:
+        verbose_name = 'счётчик'
+        verbose_name_plural = 'счётчики'
+
+    def __str__(self) -> str:
+        return f'{self.name}: {self.value}'
@@ -1,6 +1,180 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorPagination(BasePagination):
+    '''Постраничная выдача по ключу сортировки.
+
+    Вместо `OFFSET` и `COUNT(*)` следующая страница выбирается условием
+    по значению поля сортировки последнего элемента, а при равных
+    значениях - по `id`, поэтому глубина страницы не влияет на скорость.
+    '''
+
+    page_size = settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    ordering_param = OrderingFilter.ordering_param
+    default_ordering = '-created'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(request, view)
+        field = self.ordering.lstrip('-')
+        descending = self.ordering.startswith('-')
+        cursor = self.decode_cursor(request, queryset.model)
+        self.reverse = cursor is not None and cursor['reverse']
+        queryset = queryset.order_by(
+            self.ordering,
+            '-id' if descending else 'id',
+        )
+        if cursor is not None:
+            lookup = 'lt' if descending != self.reverse else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field}__{lookup}': cursor['value']})
+                | Q(**{field: cursor['value'], f'id__{lookup}': cursor['id']}),
+            )
+        if self.reverse:
+            queryset = queryset.reverse()
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.field = field
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link(),
+                'results': data,
+            },
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+    def get_ordering(self, request, view):
+        ordering = request.query_params.get(self.ordering_param, '')
+        ordering = ordering.split(',')[0].strip()
+        if ordering.lstrip('-') in getattr(view, 'ordering_fields', ()):
+            return ordering
+        return self.default_ordering
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, instance, reverse):
+        value = getattr(instance, self.field)
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        cursor = {
+            'ordering': self.ordering,
+            'value': value,
+            'id': instance.id,
+            'reverse': reverse,
+        }
+        encoded = urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            encoded,
+        )
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode()))
+            if cursor['ordering'] != self.ordering:
+                raise ValueError
+            field = model._meta.get_field(self.ordering.lstrip('-'))
+            cursor['value'] = field.to_python(cursor['value'])
+            cursor['id'] = int(cursor['id'])
+            cursor['reverse'] = bool(cursor['reverse'])
+        except (DecodeError, KeyError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
 
 
 class Pagination(PageNumberPagination):
+    '''Постраничная выдача по номеру страницы или по курсору.
+
+    По умолчанию используется выдача по номеру страницы. При
+    `pagination=cursor` или переданном `cursor` выдача идёт через
+    `CursorPagination`.
+    '''
+
     page_size = settings.PAGE_SIZE
+    mode_query_param = 'pagination'
+    cursor_class = CursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_class.cursor_query_param in request.query_params
+        ):
+            self.cursor_paginator = self.cursor_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset,
+                request,
+                view,
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': (
+                    'При `pagination=cursor` выдача идёт по курсору: в ответе '
+                    'нет `count`, а ссылки `next` и `previous` содержат '
+                    'параметр `cursor`.'
+                ),
+                'schema': {'type': 'string', 'enum': ['cursor']},
+            },
+            {
+                'name': self.cursor_class.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Курсор из ссылок `next` и `previous`.',
+                'schema': {'type': 'string'},
+            },
+        ]
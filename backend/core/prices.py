@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, Min
+
+from products.models import Product
+
+PRICE_RANGES_CACHE_KEY = 'price_ranges'
+
+
+def calculate_price_ranges():
+    return {
+        row['category']: (row['min'], row['max'])
+        for row in Product.objects.values('category')
+        .annotate(min=Min('price'), max=Max('price'))
+        .order_by()
+    }
+
+
+def refresh_price_ranges():
+    ranges = calculate_price_ranges()
+    cache.set(
+        PRICE_RANGES_CACHE_KEY,
+        ranges,
+        timeout=settings.PRICE_RANGES_CACHE_TIMEOUT,
+    )
+    return ranges
+
+
+def get_price_range(categories=None):
+    '''Минимальная и максимальная стоимость товаров.
+
+    Диапазоны по категориям хранятся в кэше и пересчитываются одним
+    сгруппированным запросом при изменении цены или категории товара.
+    Если `categories` не переданы, возвращается диапазон по всем товарам.
+    '''
+
+    ranges = cache.get(PRICE_RANGES_CACHE_KEY)
+    if ranges is None:
+        ranges = refresh_price_ranges()
+    if categories:
+        ranges = [
+            ranges[category] for category in categories if category in ranges
+        ]
+    else:
+        ranges = list(ranges.values())
+    if not ranges:
+        return {'price__min': None, 'price__max': None}
+    return {
+        'price__min': min(low for low, _ in ranges),
+        'price__max': max(high for _, high in ranges),
+    }
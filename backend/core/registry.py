@@ -0,0 +1,71 @@
+import threading
+
+from core.etags import queryset_stamp
+from products.models import Category
+
+
+class CategoryRegistry:
+    '''Категории, загруженные в память процесса.
+
+    Категорий мало, и меняются они редко, поэтому `/categories/` и
+    категории в данных товаров отдаются без загрузки категорий из базы.
+    Актуальность проверяется по версии - кол-ву категорий и времени
+    последнего изменения категорий и их изображений в базе, поэтому
+    изменение сразу видят все процессы. Версия считается одним запросом и
+    запоминается в `request`.
+    '''
+
+    request_attribute = '_category_registry_version'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._categories = {}
+
+    def get_version(self, request=None):
+        request = getattr(request, '_request', request)
+        version = getattr(request, self.request_attribute, None)
+        if version is None:
+            version = queryset_stamp(Category.objects.all(), 'image')
+            if request is not None:
+                setattr(request, self.request_attribute, version)
+        return version
+
+    def get_last_modified(self, request=None):
+        return max(filter(None, self.get_version(request)[1::2]), default=None)
+
+    def load(self, request=None):
+        from api.serializers import CategorySerializer
+
+        version = self.get_version(request)
+        if version == self._version:
+            return self._categories
+        with self._lock:
+            queryset = Category.objects.select_related('image').order_by('id')
+            categories = {
+                category.id: CategorySerializer(category).data
+                for category in queryset
+            }
+            self._categories, self._version = categories, version
+        return categories
+
+    def represent(self, category, request=None):
+        data = dict(category)
+        if request is not None and data['image_url']:
+            data['image_url'] = request.build_absolute_uri(data['image_url'])
+        return data
+
+    def all(self, request=None):
+        return [
+            self.represent(category, request)
+            for category in self.load(request).values()
+        ]
+
+    def get(self, category_id, request=None):
+        category = self.load(request).get(category_id)
+        if category is None:
+            return None
+        return self.represent(category, request)
+
+
+category_registry = CategoryRegistry()
@@ -0,0 +1,325 @@
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramWordSimilarity,
+)
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import Case, Count, Max, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+from products.models import Product
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'products_product_fts'
+WORD_RE = re.compile(r'\w+')
+
+
+def product_search_vector():
+    return SearchVector(
+        'name',
+        weight='A',
+        config=SEARCH_CONFIG,
+    ) + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+
+
+def search_products(queryset, query, ranked=True):
+    '''Полнотекстовый поиск товаров по названию и описанию.
+
+    Запрос из одних цифр сначала ищется как артикул. Если найдено меньше
+    `SEARCH_TRIGRAM_MIN_RESULTS` товаров, к ним добавляются товары с
+    похожим названием. Если `ranked`, то результаты сортируются по
+    релевантности.
+    '''
+
+    query = query.strip()
+    if not query:
+        return queryset
+    if query.isdigit():
+        by_article = queryset.filter(article=int(query))
+        if by_article.exists():
+            return by_article
+    if connection.vendor == 'postgresql':
+        found = _postgresql_search(queryset, query, ranked)
+    elif connection.vendor == 'sqlite':
+        found = _sqlite_search(queryset, query, ranked)
+    else:
+        return queryset.filter(name__icontains=query)
+    min_results = settings.SEARCH_TRIGRAM_MIN_RESULTS
+    found_ids = list(found.values_list('id', flat=True)[:min_results])
+    if len(found_ids) >= min_results:
+        return found
+    similar_ids = [
+        product_id
+        for product_id in trigram_search(queryset, query)
+        if product_id not in found_ids
+    ]
+    if not similar_ids:
+        return found
+    product_ids = found_ids + similar_ids
+    queryset = queryset.filter(id__in=product_ids)
+    if ranked:
+        queryset = queryset.order_by(
+            Case(
+                *[
+                    When(id=product_id, then=position)
+                    for position, product_id in enumerate(product_ids)
+                ],
+            ),
+        )
+    return queryset
+
+
+def _postgresql_search(queryset, query, ranked):
+    vector = product_search_vector()
+    search_query = SearchQuery(
+        query,
+        config=SEARCH_CONFIG,
+        search_type='websearch',
+    )
+    queryset = queryset.alias(search_vector=vector).filter(
+        search_vector=search_query,
+    )
+    if ranked:
+        queryset = queryset.annotate(
+            search_rank=SearchRank(vector, search_query),
+        ).order_by('-search_rank', '-id')
+    return queryset
+
+
+def _sqlite_search(queryset, query, ranked):
+    terms = WORD_RE.findall(query.lower())
+    if not terms:
+        return queryset.none()
+    match = ' '.join(f'"{term}"*' for term in terms)
+    queryset = queryset.filter(
+        id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            (match,),
+        ),
+    )
+    if ranked:
+        queryset = queryset.annotate(
+            search_rank=RawSQL(
+                f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s '
+                f'AND {FTS_TABLE}.rowid = products_product.id',
+                (match,),
+            ),
+        ).order_by('-search_rank', '-id')
+    return queryset
+
+
+def trigram_search(queryset, query):
+    '''Возвращает `id` товаров с похожим на запрос названием.
+
+    Используется, когда основной поиск почти ничего не нашёл, например
+    из-за опечатки. Поиск ограничен по времени
+    `SEARCH_TRIGRAM_TIMEOUT`: если он не уложился, результатов нет.
+    '''
+
+    if connection.vendor == 'postgresql':
+        return _postgresql_trigram_search(queryset, query)
+    similar_ids = trigram_index.search(query)[
+        : settings.SEARCH_TRIGRAM_LIMIT * 10
+    ]
+    allowed_ids = set(
+        queryset.filter(id__in=similar_ids).values_list('id', flat=True),
+    )
+    return [
+        product_id for product_id in similar_ids if product_id in allowed_ids
+    ][: settings.SEARCH_TRIGRAM_LIMIT]
+
+
+def set_local_settings(cursor, values):
+    '''Меняет параметры PostgreSQL до конца транзакции.
+
+    Возвращает прежние значения параметров, чтобы их можно было вернуть.
+    '''
+
+    names = list(values)
+    cursor.execute(
+        'SELECT ' + ', '.join(['current_setting(%s)'] * len(names)),
+        names,
+    )
+    previous = dict(zip(names, cursor.fetchone()))
+    cursor.execute(
+        'SELECT ' + ', '.join(['set_config(%s, %s, true)'] * len(names)),
+        [param for item in values.items() for param in item],
+    )
+    return previous
+
+
+def _postgresql_trigram_search(queryset, query):
+    # SET LOCAL в точке сохранения действует до конца внешней транзакции,
+    # поэтому после запроса прежние значения возвращаются.
+    values = {
+        'statement_timeout': str(int(settings.SEARCH_TRIGRAM_TIMEOUT * 1000)),
+        'pg_trgm.word_similarity_threshold': str(
+            settings.SEARCH_TRIGRAM_THRESHOLD,
+        ),
+    }
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            previous = set_local_settings(cursor, values)
+            similar_ids = list(
+                queryset.filter(name__trigram_word_similar=query)
+                .annotate(similarity=TrigramWordSimilarity(query, 'name'))
+                .order_by('-similarity', '-id')
+                .values_list('id', flat=True)[: settings.SEARCH_TRIGRAM_LIMIT],
+            )
+            set_local_settings(cursor, previous)
+    except DatabaseError:
+        return []
+    return similar_ids
+
+
+def trigrams(word):
+    word = f'  {word} '
+    return {''.join(chars) for chars in zip(word, word[1:], word[2:])}
+
+
+def word_trigrams(text):
+    return [
+        trigrams(word)
+        for word in WORD_RE.findall(text.lower().replace('ё', 'е'))
+    ]
+
+
+executor = (
+    ThreadPoolExecutor(max_workers=1, thread_name_prefix='trigram-index')
+    if settings.SEARCH_TRIGRAM_BACKGROUND_REBUILD
+    else None
+)
+
+
+class TrigramIndex:
+    '''Триграммный индекс названий товаров в памяти процесса.
+
+    Нужен там, где нет `pg_trgm` (SQLite). Индекс перестраивается в
+    фоновом потоке, когда меняется число товаров или дата последнего
+    изменения, а поиск тем временем идёт по прежнему индексу. При
+    `SEARCH_TRIGRAM_BACKGROUND_REBUILD = False` индекс перестраивается в
+    запросе, и время перестройки входит в `SEARCH_TRIGRAM_TIMEOUT`.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._scheduled = None
+        self._index = ({}, {})
+
+    def get_version(self):
+        return Product.objects.aggregate(
+            count=Count('id'),
+            modified=Max(Coalesce('modified', 'created')),
+        )
+
+    def rebuild(self, version):
+        with self._lock:
+            if version == self._version:
+                return
+            postings = defaultdict(set)
+            words = {}
+            for product_id, name in Product.objects.values_list('id', 'name'):
+                words[product_id] = word_trigrams(name)
+                for word in words[product_id]:
+                    for trigram in word:
+                        postings[trigram].add(product_id)
+            self._index = (postings, words)
+            self._version = version
+
+    def run_rebuild(self, version):
+        try:
+            self.rebuild(version)
+        except Exception:
+            logger.exception('Не удалось перестроить триграммный индекс')
+        finally:
+            self._scheduled = None
+            connection.close()
+
+    def refresh(self):
+        version = self.get_version()
+        if version == self._version:
+            return
+        if executor is None:
+            self.rebuild(version)
+        elif version != self._scheduled:
+            self._scheduled = version
+            executor.submit(self.run_rebuild, version)
+
+    def search(self, query):
+        query_words = word_trigrams(query)
+        if not query_words:
+            return []
+        deadline = time.monotonic() + settings.SEARCH_TRIGRAM_TIMEOUT
+        self.refresh()
+        postings, words = self._index
+        candidates = set().union(
+            *(
+                postings.get(trigram, ())
+                for word in query_words
+                for trigram in word
+            ),
+        )
+        scores = {}
+        for product_id in candidates:
+            if time.monotonic() > deadline:
+                return []
+            score = sum(
+                max(
+                    len(query_word & word) / len(query_word | word)
+                    for word in words[product_id]
+                )
+                for query_word in query_words
+            ) / len(query_words)
+            if score >= settings.SEARCH_TRIGRAM_THRESHOLD:
+                scores[product_id] = score
+        return sorted(scores, key=lambda product_id: -scores[product_id])
+
+
+trigram_index = TrigramIndex()
+
+
+def install_sqlite_search(using='default', **kwargs):
+    '''Создаёт FTS5-индекс товаров и триггеры для его обновления.
+
+    Вызывается после каждой миграции: SQLite пересоздаёт таблицу при
+    изменении её схемы и теряет триггеры.
+    '''
+
+    if connections[using].vendor != 'sqlite':
+        return
+    with connections[using].cursor() as cursor:
+        for sql in (
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+            "name, description, content='products_product', "
+            "content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+            f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert '
+            'AFTER INSERT ON products_product BEGIN '
+            f'INSERT INTO {FTS_TABLE}(rowid, name, description) '
+            'VALUES (new.id, new.name, new.description); END',
+            f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete '
+            'AFTER DELETE ON products_product BEGIN '
+            f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) '
+            "VALUES ('delete', old.id, old.name, old.description); END",
+            f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update '
+            'AFTER UPDATE OF name, description ON products_product BEGIN '
+            f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) '
+            "VALUES ('delete', old.id, old.name, old.description); "
+            f'INSERT INTO {FTS_TABLE}(rowid, name, description) '
+            'VALUES (new.id, new.name, new.description); END',
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+        ):
+            cursor.execute(sql)
@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+from core.models import Counter
+
+PRODUCT_ARTICLE = 'product_article'
+ORDER_NUMBER = 'order_number'
+
+
+def get_sequences():
+    '''Последовательности и первые выдаваемые ими номера.'''
+
+    return {
+        PRODUCT_ARTICLE: settings.FIRST_ARTICLE,
+        ORDER_NUMBER: settings.FIRST_ORDER_NUMBER,
+    }
+
+
+def get_sequence_name(name):
+    '''Имя последовательности PostgreSQL.'''
+
+    return f'{name}_seq'
+
+
+def reserve_from_sequence(name, count):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT nextval(%s) FROM generate_series(1, %s)',
+            [get_sequence_name(name), count],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def reserve_from_counter(name, count):
+    '''Номера из таблицы счётчиков.
+
+    `UPDATE` блокирует строку счётчика до конца транзакции, поэтому
+    параллельные запросы получают непересекающиеся блоки номеров.
+    '''
+
+    with transaction.atomic():
+        updated = Counter.objects.filter(name=name).update(
+            value=F('value') + count,
+        )
+        if not updated:
+            try:
+                with transaction.atomic():
+                    Counter.objects.create(
+                        name=name,
+                        value=get_sequences()[name] - 1 + count,
+                    )
+            except IntegrityError:
+                return reserve_from_counter(name, count)
+        value = Counter.objects.values_list('value', flat=True).get(name=name)
+    return list(range(value - count + 1, value + 1))
+
+
+def reserve(name, count):
+    '''Резервирует `count` уникальных номеров последовательности `name`.
+
+    На PostgreSQL номера берутся из последовательности базы и не
+    возвращаются при откате транзакции, на остальных базах - из таблицы
+    `Counter`. Номера возрастают, но могут идти с пропусками.
+    '''
+
+    if count < 1:
+        return []
+    if connection.vendor == 'postgresql':
+        return reserve_from_sequence(name, count)
+    return reserve_from_counter(name, count)
+
+
+def next_value(name):
+    '''Следующий номер последовательности `name`.'''
+
+    return reserve(name, 1)[0]
@@ -1,41 +1,121 @@
-from django.db.models import Avg
-
-from products.models import Favorite, Order, Review, ShoppingCart
-
-
-def find_rating(product_id):
-    review = Review.objects.filter(product=product_id)
-    if review.exists():
-        return [
-            round(review.aggregate(Avg('rating'))['rating__avg'], 1),
-            review.count(),
-        ]
-    return [None, None]
-
-
-def check_is_favorited(user, product_id):
-    if user.is_anonymous:
-        return False
-    return Favorite.objects.filter(
-        user=user,
-        product=product_id,
-    ).exists()
-
-
-def check_is_in_shopping_cart(user, product_id):
-    if user.is_anonymous:
-        return False
-    return ShoppingCart.objects.filter(
-        owner=user,
-        shoppingcart_items__item=product_id,
-    ).exists()
-
-
-def check_is_buying(user, product_id):
-    if user.is_anonymous:
-        return False
-    return Order.objects.filter(
-        user=user,
-        product_list__order_with_product__product=product_id,
-        is_paid=True,
-    ).exists()
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Count, F, Prefetch, Q, Sum
+
+from products.models import (
+    Image,
+    ProductRating,
+    Review,
+    ShoppingCart_Items,
+)
+from users.models import Seller
+
+RATING_FIELDS = ('rating_sum', 'rating_count') + tuple(
+    f'rating_{star}' for star in range(1, 6)
+)
+
+
+def get_rating(product):
+    try:
+        stats = product.rating_stats
+    except ObjectDoesNotExist:
+        return [None, None]
+    if not stats.rating_count:
+        return [None, None]
+    return [round(stats.average, 1), stats.rating_count]
+
+
+def gallery_prefetch():
+    '''Изображения товаров одним запросом в порядке галереи.'''
+
+    return Prefetch(
+        'images',
+        queryset=Image.objects.order_by(
+            'imageproduct__position',
+            'imageproduct__id',
+        ),
+    )
+
+
+def annotate_storefront(queryset):
+    return queryset.annotate(
+        store_name=F('user__seller__store_name'),
+        store_logo=F('user__seller__logo'),
+        store_logo_derivatives=F('user__seller__logo_derivatives'),
+    )
+
+
+def get_storefront(product):
+    '''Название магазина, путь к логотипу и копии логотипа продавца.
+
+    Берутся из аннотаций `annotate_storefront`, а для товара из выборки без
+    них - одним запросом.
+    '''
+
+    if not hasattr(product, 'store_name'):
+        (
+            product.store_name,
+            product.store_logo,
+            product.store_logo_derivatives,
+        ) = Seller.objects.filter(user_id=product.user_id).values_list(
+            'store_name',
+            'logo',
+            'logo_derivatives',
+        ).first() or (
+            None,
+            None,
+            None,
+        )
+    if not product.store_logo:
+        return product.store_name, None, None
+    logo = Seller._meta.get_field('logo').storage.url(product.store_logo)
+    return product.store_name, logo, product.store_logo_derivatives
+
+
+def update_rating_stats(product_id, added=None, removed=None):
+    stats, _ = ProductRating.objects.select_for_update().get_or_create(
+        product_id=product_id,
+    )
+    if removed is not None:
+        stats.apply(removed, -1)
+    if added is not None:
+        stats.apply(added, 1)
+    stats.save()
+
+
+def calculate_rating_stats():
+    return (
+        Review.objects.values('product')
+        .annotate(
+            rating_sum=Sum('rating'),
+            rating_count=Count('id'),
+            **{
+                f'rating_{star}': Count('id', filter=Q(rating=star))
+                for star in range(1, 6)
+            },
+        )
+        .order_by()
+    )
+
+
+class CartSnapshot:
+    '''Товары корзины из одного запроса.
+
+    Товарам из `products` добавлены `cart_quantity` и `cart_is_selected`
+    их строк в корзине.
+    '''
+
+    def __init__(self, cart):
+        self.lines = list(
+            ShoppingCart_Items.objects.filter(cart=cart)
+            .select_related('item')
+            .order_by('-item__created'),
+        )
+
+    @property
+    def products(self):
+        products = []
+        for line in self.lines:
+            line.item.cart_quantity = line.quantity
+            line.item.cart_is_selected = line.is_selected
+            products.append(line.item)
+        return products
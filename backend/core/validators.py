@@ -32,10 +32,9 @@ def validate_send_to(send_to, context):
 
 def validate_cart(context):
     user = context.get('request').user
-    cart = ShoppingCart_Items.objects.filter(
+    if ShoppingCart_Items.objects.filter(
         cart__owner=user,
         is_selected=True,
-    )
-    if cart:
+    ).exists():
         return True
     raise ValidationError({'message': 'Ваша корзина пуста.'})
@@ -9,6 +9,7 @@ from products.models import (
     Order,
     OrderProductList,
     Product,
+    ProductRating,
     Review,
     ShoppingCart,
     ShoppingCart_Items,
@@ -49,6 +50,11 @@ class ProductAdmin(BaseAdmin):
     short_name.short_description = 'название'
 
 
+@admin.register(ProductRating)
+class ProductRatingAdmin(BaseAdmin):
+    list_display = ('product', 'average', 'rating_count')
+
+
 @admin.register(Order)
 class OrderAdmin(BaseAdmin):
     inlines = (OrderProductListInline,)
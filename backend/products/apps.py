@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ProductsConfig(AppConfig):
     name = 'products'
     verbose_name = 'продукты'
+
+    def ready(self):
+        from core.search import install_sqlite_search
+        from products import signals  # noqa: F401
+
+        post_migrate.connect(install_sqlite_search, sender=self)
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from core.images import build_derivatives
+from products.models import Image
+from users.models import Seller, User
+
+SOURCES = ((Image, 'image'), (User, 'photo'), (Seller, 'logo'))
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит уменьшенные копии изображений, у которых их ещё нет: '
+        'изображений товаров, фотографий пользователей и логотипов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Перестроить копии и для изображений, у которых они есть.',
+        )
+
+    def handle(self, *args, **options):
+        built = failed = 0
+        for model, field_name in SOURCES:
+            queryset = model.objects.exclude(
+                **{f'{field_name}__isnull': True},
+            ).exclude(**{field_name: ''})
+            if not options['force']:
+                queryset = queryset.filter(
+                    **{f'{field_name}_derivatives': {}},
+                )
+            for pk in queryset.values_list('pk', flat=True).iterator():
+                try:
+                    build_derivatives(model, pk, field_name)
+                except (OSError, ValueError) as error:
+                    failed += 1
+                    self.stderr.write(
+                        f'{model.__name__} {pk}: {error}',
+                    )
+                else:
+                    built += 1
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Построено: {built}, с ошибками: {failed}.',
+            ),
+        )
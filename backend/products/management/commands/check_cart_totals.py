@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.carts import (
+    TOTALS_FIELDS,
+    get_drifted_carts,
+    recalculate_cart_totals,
+)
+from products.models import ShoppingCart
+
+
+class Command(BaseCommand):
+    help = (
+        'Ищет корзины, сохранённые итоги которых разошлись с их строками, '
+        'и с `--fix` пересчитывает их.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Пересчитать итоги найденных корзин.',
+        )
+
+    def handle(self, *args, **options):
+        drifted = []
+        for cart in get_drifted_carts().iterator():
+            drifted.append(cart.pk)
+            changes = ', '.join(
+                f'{field} {getattr(cart, field)} -> '
+                f'{getattr(cart, f"calculated_{field}")}'
+                for field in TOTALS_FIELDS
+                if getattr(cart, field) != getattr(cart, f'calculated_{field}')
+            )
+            self.stderr.write(f'Корзина {cart.pk}: {changes}')
+        if drifted and options['fix']:
+            with transaction.atomic():
+                recalculate_cart_totals(
+                    ShoppingCart.objects.filter(pk__in=drifted),
+                )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Расхождений: {len(drifted)}'
+                + (', исправлено.' if drifted and options['fix'] else '.'),
+            ),
+        )
@@ -0,0 +1,151 @@
+from functools import partial
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.images import delete_unused_file
+from products.models import Category, Image, ImageProduct
+from products.utils import get_file_hash
+
+
+class Command(BaseCommand):
+    help = (
+        'Считает хеши содержимого изображений, загруженных до их появления, '
+        'и объединяет повторы: у каждого пользователя остаётся одна запись '
+        'на содержимое, а записи всех пользователей ссылаются на один файл.'
+    )
+
+    def handle(self, *args, **options):
+        groups, failed = {}, 0
+        images = (
+            Image.objects.filter(content_hash='')
+            .exclude(image__isnull=True)
+            .exclude(image='')
+            .values_list('pk', 'image')
+        )
+        for pk, name in images.iterator():
+            try:
+                with default_storage.open(name) as file:
+                    content_hash = get_file_hash(file)
+            except OSError as error:
+                failed += 1
+                self.stderr.write(f'Image {pk}: {error}')
+            else:
+                groups.setdefault(content_hash, []).append(pk)
+        hashed = merged = 0
+        for content_hash, pks in groups.items():
+            with transaction.atomic():
+                counts = self.merge(content_hash, pks)
+            hashed += counts[0]
+            merged += counts[1]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Хешей записано: {hashed}, повторов объединено: {merged}, '
+                f'с ошибками: {failed}.',
+            ),
+        )
+
+    def merge(self, content_hash, pks):
+        '''Объединяет записи `pks` с одинаковым содержимым.
+
+        Записи пользователя, кроме одной, удаляются, а их товары и
+        категории переходят к оставшейся. Запись, которую нельзя удалить,
+        потому что у оставшейся уже есть своя категория, остаётся без
+        хеша, но тоже ссылается на общий файл. Возвращает кол-во записей,
+        получивших хеш, и кол-во удалённых.
+        '''
+
+        rows = list(
+            Image.objects.select_for_update()
+            .filter(pk__in=pks, content_hash='')
+            .order_by('pk'),
+        )
+        if not rows:
+            return 0, 0
+        stored = (
+            Image.objects.select_for_update()
+            .filter(content_hash=content_hash)
+            .exclude(image='')
+            .values('image', 'image_derivatives')
+            .first()
+        ) or {
+            'image': rows[0].image.name,
+            'image_derivatives': rows[0].image_derivatives,
+        }
+        with_category = set(
+            Category.objects.filter(image__in=rows).values_list(
+                'image_id',
+                flat=True,
+            ),
+        )
+        by_user = {}
+        for row in rows:
+            by_user.setdefault(row.user_id, []).append(row)
+        hashed, unhashed, removed = [], [], []
+        for user_rows in by_user.values():
+            kept, moved = self.merge_user(
+                content_hash, user_rows, with_category
+            )
+            if kept is not None:
+                hashed.append(kept)
+            for row in user_rows:
+                if row.pk in moved:
+                    removed.append(row.pk)
+                elif row is not kept:
+                    unhashed.append(row)
+        now = timezone.now()
+        for row in hashed + unhashed:
+            if row.image.name != stored['image']:
+                transaction.on_commit(
+                    partial(
+                        delete_unused_file,
+                        row.image.name,
+                        row.image_derivatives,
+                    ),
+                )
+        Image.objects.filter(pk__in=[row.pk for row in hashed]).update(
+            content_hash=content_hash,
+            modified=now,
+            **stored,
+        )
+        Image.objects.filter(pk__in=[row.pk for row in unhashed]).update(
+            modified=now,
+            **stored,
+        )
+        Image.objects.filter(pk__in=removed).delete()
+        return len(hashed), len(removed)
+
+    def merge_user(self, content_hash, rows, with_category):
+        '''Переносит товары и категории записей пользователя на одну.
+
+        Остаётся уже хешированная запись пользователя или, если её нет,
+        запись с категорией либо первая. Возвращает новую запись для хеша
+        или `None` и множество записей, которые можно удалить.
+        '''
+
+        kept = Image.objects.filter(
+            user_id=rows[0].user_id,
+            content_hash=content_hash,
+        ).first()
+        created = kept is None
+        if created:
+            kept = next(
+                (row for row in rows if row.pk in with_category),
+                rows[0],
+            )
+        elif Category.objects.filter(image=kept).exists():
+            with_category.add(kept.pk)
+        moved = set()
+        for row in rows:
+            if row is kept:
+                continue
+            if row.pk in with_category:
+                if kept.pk in with_category:
+                    continue
+                Category.objects.filter(image=row).update(image=kept)
+                with_category.add(kept.pk)
+            ImageProduct.objects.filter(image=row).update(image=kept)
+            moved.add(row.pk)
+        return (kept if created else None), moved
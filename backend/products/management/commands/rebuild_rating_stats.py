@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.utils import RATING_FIELDS, calculate_rating_stats
+from products.models import ProductRating
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рейтинги товаров по отзывам и сообщает о расхождениях.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сообщить о расхождениях, ничего не изменяя.',
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        expected = {
+            row.pop('product'): row for row in calculate_rating_stats()
+        }
+        stored = {
+            stats.product_id: stats
+            for stats in ProductRating.objects.select_for_update()
+        }
+        empty = dict.fromkeys(RATING_FIELDS, 0)
+        now = timezone.now()
+        changed = []
+        for product_id in expected.keys() | stored.keys():
+            values = expected.get(product_id, empty)
+            stats = stored.get(product_id) or ProductRating(
+                product_id=product_id,
+            )
+            drift = {
+                field: (getattr(stats, field), value)
+                for field, value in values.items()
+                if getattr(stats, field) != value
+            }
+            if not drift:
+                continue
+            self.stdout.write(
+                f'Товар {product_id}: '
+                + ', '.join(
+                    f'{field} {old} -> {new}'
+                    for field, (old, new) in drift.items()
+                ),
+            )
+            for field, value in values.items():
+                setattr(stats, field, value)
+            stats.update_average()
+            stats.modified = now
+            changed.append(stats)
+        if not options['check']:
+            ProductRating.objects.bulk_create(
+                [stats for stats in changed if stats.product_id not in stored],
+                batch_size=500,
+            )
+            ProductRating.objects.bulk_update(
+                [stats for stats in changed if stats.product_id in stored],
+                RATING_FIELDS + ('average', 'modified'),
+                batch_size=500,
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f'Расхождений найдено: {len(changed)}.'),
+        )
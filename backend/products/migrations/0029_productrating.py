@@ -0,0 +1,112 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_rating_stats(apps, schema_editor):
+    Review = apps.get_model("products", "Review")
+    ProductRating = apps.get_model("products", "ProductRating")
+    stats = (
+        Review.objects.values("product")
+        .annotate(
+            rating_sum=Sum("rating"),
+            rating_count=Count("id"),
+            **{
+                f"rating_{star}": Count("id", filter=Q(rating=star))
+                for star in range(1, 6)
+            },
+        )
+        .order_by()
+    )
+    ProductRating.objects.bulk_create(
+        [
+            ProductRating(
+                product_id=row.pop("product"),
+                average=row["rating_sum"] / row["rating_count"],
+                **row,
+            )
+            for row in stats
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0028_category_is_used"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductRating",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="rating_stats",
+                        serialize=False,
+                        to="products.product",
+                        verbose_name="продукт",
+                    ),
+                ),
+                (
+                    "average",
+                    models.FloatField(
+                        blank=True,
+                        db_index=True,
+                        null=True,
+                        verbose_name="средний рейтинг",
+                    ),
+                ),
+                (
+                    "rating_sum",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="сумма оценок"
+                    ),
+                ),
+                (
+                    "rating_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="количество оценок"
+                    ),
+                ),
+                (
+                    "rating_1",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="оценок «1»"
+                    ),
+                ),
+                (
+                    "rating_2",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="оценок «2»"
+                    ),
+                ),
+                (
+                    "rating_3",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="оценок «3»"
+                    ),
+                ),
+                (
+                    "rating_4",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="оценок «4»"
+                    ),
+                ),
+                (
+                    "rating_5",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="оценок «5»"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "рейтинг товара",
+                "verbose_name_plural": "рейтинги товаров",
+            },
+        ),
+        migrations.RunPython(fill_rating_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+SEARCH_INDEX = GinIndex(
+    SearchVector("name", weight="A", config="russian")
+    + SearchVector("description", weight="B", config="russian"),
+    name="product_search_idx",
+)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.add_index(apps.get_model("products", "Product"), SEARCH_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.remove_index(
+        apps.get_model("products", "Product"), SEARCH_INDEX
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0030_product_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,36 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+TRIGRAM_INDEX = GinIndex(
+    fields=["name"],
+    name="product_name_trgm_idx",
+    opclasses=["gin_trgm_ops"],
+)
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.add_index(
+        apps.get_model("products", "Product"), TRIGRAM_INDEX
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.remove_index(
+        apps.get_model("products", "Product"), TRIGRAM_INDEX
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0031_product_search_index"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0032_product_name_trigram_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="shoppingcart",
+            name="version",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Версия корзины"
+            ),
+        ),
+    ]
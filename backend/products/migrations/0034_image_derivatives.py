@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0033_shoppingcart_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="image_derivatives",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                verbose_name="уменьшенные копии",
+            ),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+import products.models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0034_image_derivatives"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="content_hash",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                max_length=64,
+                verbose_name="хеш содержимого",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="image",
+            name="image",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                upload_to=products.models.content_directory_path,
+                verbose_name="изображение",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="image",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("content_hash", ""), _negated=True),
+                fields=("user", "content_hash"),
+                name="unique_user_image_content",
+            ),
+        ),
+    ]
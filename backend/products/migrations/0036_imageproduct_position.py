@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+def fill_positions(apps, schema_editor):
+    ImageProduct = apps.get_model("products", "ImageProduct")
+    links = []
+    positions = {}
+    for link in ImageProduct.objects.order_by("product", "id").iterator():
+        link.position = positions.get(link.product_id, 0)
+        positions[link.product_id] = link.position + 1
+        links.append(link)
+    ImageProduct.objects.bulk_update(links, ["position"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0035_image_content_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="imageproduct",
+            name="position",
+            field=models.PositiveSmallIntegerField(
+                default=0, verbose_name="позиция в галерее"
+            ),
+        ),
+        migrations.RunPython(fill_positions, migrations.RunPython.noop),
+    ]
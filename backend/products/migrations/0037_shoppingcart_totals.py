@@ -0,0 +1,60 @@
+from django.db import migrations, models
+
+
+def fill_totals(apps, schema_editor):
+    ShoppingCart = apps.get_model("products", "ShoppingCart")
+    ShoppingCartItems = apps.get_model("products", "ShoppingCart_Items")
+    carts = {}
+    lines = ShoppingCartItems.objects.values_list(
+        "cart", "quantity", "is_selected", "item__price"
+    )
+    for cart, quantity, is_selected, price in lines.iterator():
+        totals = carts.setdefault(cart, [0, 0, 0])
+        totals[0] += quantity
+        if is_selected:
+            totals[1] += quantity
+            totals[2] += quantity * price
+    ShoppingCart.objects.bulk_update(
+        [
+            ShoppingCart(
+                pk=cart,
+                total_quantity=totals[0],
+                selected_quantity=totals[1],
+                selected_cost=totals[2],
+            )
+            for cart, totals in carts.items()
+        ],
+        ["total_quantity", "selected_quantity", "selected_cost"],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0036_imageproduct_position"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="shoppingcart",
+            name="selected_cost",
+            field=models.PositiveBigIntegerField(
+                default=0, verbose_name="Стоимость выбранных товаров"
+            ),
+        ),
+        migrations.AddField(
+            model_name="shoppingcart",
+            name="selected_quantity",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Кол-во выбранных товаров"
+            ),
+        ),
+        migrations.AddField(
+            model_name="shoppingcart",
+            name="total_quantity",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Кол-во товаров"
+            ),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicates(apps, schema_editor):
+    ShoppingCart = apps.get_model("products", "ShoppingCart")
+    ShoppingCartItems = apps.get_model("products", "ShoppingCart_Items")
+    duplicates = list(
+        ShoppingCartItems.objects.values("cart", "item")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    carts = set()
+    for duplicate in duplicates:
+        lines = list(
+            ShoppingCartItems.objects.filter(
+                cart=duplicate["cart"], item=duplicate["item"]
+            ).order_by("id")
+        )
+        kept = lines[0]
+        kept.quantity = sum(line.quantity for line in lines)
+        kept.is_selected = any(line.is_selected for line in lines)
+        kept.save(update_fields=["quantity", "is_selected"])
+        ShoppingCartItems.objects.filter(
+            pk__in=[line.pk for line in lines[1:]]
+        ).delete()
+        carts.add(duplicate["cart"])
+    for cart in ShoppingCart.objects.filter(pk__in=carts):
+        lines = ShoppingCartItems.objects.filter(cart=cart).values_list(
+            "quantity", "is_selected", "item__price"
+        )
+        cart.total_quantity = cart.selected_quantity = cart.selected_cost = 0
+        for quantity, is_selected, price in lines:
+            cart.total_quantity += quantity
+            if is_selected:
+                cart.selected_quantity += quantity
+                cart.selected_cost += quantity * price
+        cart.save(
+            update_fields=[
+                "total_quantity",
+                "selected_quantity",
+                "selected_cost",
+            ]
+        )
+
+
+class Migration(migrations.Migration):
+    # Ограничение добавляется после фиксации слияния: PostgreSQL не даёт
+    # менять таблицу с отложенными проверками внешних ключей в той же
+    # транзакции, где из неё удалялись строки.
+    atomic = False
+
+    dependencies = [
+        ("products", "0037_shoppingcart_totals"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicates, migrations.RunPython.noop, atomic=True
+        ),
+        migrations.AddConstraint(
+            model_name="shoppingcart_items",
+            constraint=models.UniqueConstraint(
+                fields=("cart", "item"), name="unique_cart_item"
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0038_shoppingcart_items_unique_cart_item"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productrating",
+            name="modified",
+            field=models.DateTimeField(
+                auto_now=True, verbose_name="дата изменения"
+            ),
+        ),
+    ]
@@ -1,14 +1,17 @@
-from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
+import os
+
 from django.core.validators import (
     MaxValueValidator,
     MinLengthValidator,
     MinValueValidator,
 )
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
 
 from core.models import TimestampedModel
-from products.utils import cut_string
+from core.sequences import ORDER_NUMBER, PRODUCT_ARTICLE, next_value
+from products.utils import cut_string, get_file_hash
 from users.models import User
 
 PAY_METHOD_CHOICES = [
@@ -21,6 +24,14 @@ def user_directory_path(instance, filename):
     return f'products/{instance.user.id}/{filename}'
 
 
+def content_directory_path(instance, filename):
+    if not instance.content_hash:
+        instance.content_hash = get_file_hash(instance.image)
+    content_hash = instance.content_hash
+    extension = os.path.splitext(filename)[1].lower()
+    return f'images/{content_hash[:2]}/{content_hash}{extension}'
+
+
 class Image(TimestampedModel):
     user = models.ForeignKey(
         User,
@@ -29,14 +40,34 @@ class Image(TimestampedModel):
     )
     image = models.ImageField(
         'изображение',
-        upload_to=user_directory_path,
+        upload_to=content_directory_path,
         blank=True,
         null=True,
     )
+    content_hash = models.CharField(
+        'хеш содержимого',
+        max_length=64,
+        blank=True,
+        db_index=True,
+        editable=False,
+    )
+    image_derivatives = models.JSONField(
+        'уменьшенные копии',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'изображение'
         verbose_name_plural = 'изображения'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'content_hash'),
+                condition=~models.Q(content_hash=''),
+                name='unique_user_image_content',
+            ),
+        ]
 
 
 class Category(TimestampedModel):
@@ -73,10 +104,7 @@ class Category(TimestampedModel):
 
 class Product(TimestampedModel):
     def get_article():
-        try:
-            return Product.objects.latest('id').article + 1
-        except ObjectDoesNotExist:
-            return settings.FIRST_ARTICLE
+        return next_value(PRODUCT_ARTICLE)
 
     user = models.ForeignKey(
         User,
@@ -127,6 +155,13 @@ class Product(TimestampedModel):
         verbose_name = 'товар'
         verbose_name_plural = 'товары'
         ordering = ('-created',)
+        indexes = [
+            models.Index(
+                fields=('created', 'id'),
+                name='product_created_id_idx',
+            ),
+            models.Index(fields=('price', 'id'), name='product_price_id_idx'),
+        ]
 
     def __str__(self) -> str:
         return cut_string(self.name)
@@ -135,6 +170,10 @@ class Product(TimestampedModel):
 class ImageProduct(models.Model):
     image = models.ForeignKey(Image, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    position = models.PositiveSmallIntegerField(
+        'позиция в галерее',
+        default=0,
+    )
 
     class Meta:
         verbose_name = 'изображение в товаре'
@@ -187,13 +226,52 @@ class Review(TimestampedModel):
         return cut_string(self.text)
 
 
+class ProductRating(models.Model):
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='rating_stats',
+        verbose_name='продукт',
+    )
+    average = models.FloatField(
+        'средний рейтинг',
+        blank=True,
+        null=True,
+        db_index=True,
+    )
+    rating_sum = models.PositiveIntegerField('сумма оценок', default=0)
+    rating_count = models.PositiveIntegerField('количество оценок', default=0)
+    rating_1 = models.PositiveIntegerField('оценок «1»', default=0)
+    rating_2 = models.PositiveIntegerField('оценок «2»', default=0)
+    rating_3 = models.PositiveIntegerField('оценок «3»', default=0)
+    rating_4 = models.PositiveIntegerField('оценок «4»', default=0)
+    rating_5 = models.PositiveIntegerField('оценок «5»', default=0)
+    modified = models.DateTimeField('дата изменения', auto_now=True)
+
+    class Meta:
+        verbose_name = 'рейтинг товара'
+        verbose_name_plural = 'рейтинги товаров'
+
+    def __str__(self):
+        return f'{self.product} {self.average}'
+
+    def apply(self, rating, delta):
+        field = f'rating_{rating}'
+        setattr(self, field, getattr(self, field) + delta)
+        self.rating_sum += rating * delta
+        self.rating_count += delta
+        self.update_average()
+
+    def update_average(self):
+        self.average = (
+            self.rating_sum / self.rating_count if self.rating_count else None
+        )
+
+
 class Order(TimestampedModel):
     def get_number_order():
-        try:
-            last_order = Order.objects.latest('number_order')
-            return last_order.number_order + 1
-        except Exception:
-            return settings.FIRST_ORDER_NUMBER
+        return next_value(ORDER_NUMBER)
 
     user = models.ForeignKey(
         User,
@@ -283,6 +361,22 @@ class ShoppingCart(TimestampedModel):
         null=True,
         verbose_name='Процент скидки',
     )
+    version = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Версия корзины',
+    )
+    total_quantity = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Кол-во товаров',
+    )
+    selected_quantity = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Кол-во выбранных товаров',
+    )
+    selected_cost = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Стоимость выбранных товаров',
+    )
 
     class Meta:
         verbose_name = 'корзина пользователя'
@@ -291,6 +385,48 @@ class ShoppingCart(TimestampedModel):
     def __str__(self):
         return f'Корзина пользователя {self.owner.username}'
 
+    def bump_version(self, **fields):
+        '''Записывает поля `fields` и отмечает изменение корзины.
+
+        Поля и версия меняются у экземпляра и в базе одним запросом в
+        транзакции, заблокировавшей корзину.
+        '''
+
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.version += 1
+        self.modified = timezone.now()
+        ShoppingCart.objects.filter(pk=self.pk).update(
+            version=F('version') + 1,
+            modified=self.modified,
+            **fields,
+        )
+
+    def change_totals(
+        self,
+        total_quantity=0,
+        selected_quantity=0,
+        selected_cost=0,
+    ):
+        '''Сдвигает итоги корзины и её версию одним запросом.
+
+        Вызывается в транзакции, заблокировавшей корзину, поэтому итоги
+        экземпляра после вызова совпадают с записанными в базу.
+        '''
+
+        self.total_quantity += total_quantity
+        self.selected_quantity += selected_quantity
+        self.selected_cost += selected_cost
+        self.version += 1
+        self.modified = timezone.now()
+        ShoppingCart.objects.filter(pk=self.pk).update(
+            total_quantity=F('total_quantity') + total_quantity,
+            selected_quantity=F('selected_quantity') + selected_quantity,
+            selected_cost=F('selected_cost') + selected_cost,
+            version=F('version') + 1,
+            modified=self.modified,
+        )
+
 
 class ShoppingCart_Items(models.Model):
     item = models.ForeignKey(
@@ -313,6 +449,12 @@ class ShoppingCart_Items(models.Model):
     class Meta:
         verbose_name = 'товар в корзине'
         verbose_name_plural = 'товары в корзине'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('cart', 'item'),
+                name='unique_cart_item',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.item.name} в корзине пользователя {self.cart.owner}'
@@ -0,0 +1,91 @@
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete,
+    post_init,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from core.carts import recalculate_cart_totals
+from core.images import (
+    delete_unused_file,
+    get_image_name,
+    release_images,
+    schedule_derivatives,
+)
+from core.prices import refresh_price_ranges
+from products.models import Image, ImageProduct, Product, ShoppingCart
+
+
+@receiver(post_init, sender=Product)
+def remember_price_range_fields(sender, instance, **kwargs):
+    instance._price_range_fields = (instance.price, instance.category_id)
+
+
+@receiver(post_save, sender=Product)
+def update_price_ranges_on_save(sender, instance, created, **kwargs):
+    fields = (instance.price, instance.category_id)
+    if created or fields != instance._price_range_fields:
+        transaction.on_commit(refresh_price_ranges)
+    instance._price_range_fields = fields
+
+
+@receiver(post_delete, sender=Product)
+def update_price_ranges_on_delete(sender, instance, **kwargs):
+    transaction.on_commit(refresh_price_ranges)
+
+
+@receiver(post_init, sender=Product)
+def remember_cart_price(sender, instance, **kwargs):
+    instance._cart_price = instance.price
+
+
+@receiver(post_save, sender=Product)
+def update_cart_totals_on_save(sender, instance, created, **kwargs):
+    if not created and instance.price != instance._cart_price:
+        recalculate_cart_totals(ShoppingCart.objects.filter(items=instance))
+    instance._cart_price = instance.price
+
+
+@receiver(pre_delete, sender=Product)
+def remember_product_carts(sender, instance, **kwargs):
+    instance._cart_ids = list(
+        ShoppingCart.objects.filter(items=instance).values_list(
+            'pk',
+            flat=True,
+        ),
+    )
+
+
+@receiver(post_delete, sender=Product)
+def update_cart_totals_on_delete(sender, instance, **kwargs):
+    if instance._cart_ids:
+        recalculate_cart_totals(
+            ShoppingCart.objects.filter(pk__in=instance._cart_ids),
+        )
+
+
+@receiver(post_init, sender=Image)
+def remember_image_name(sender, instance, **kwargs):
+    instance._image_name = get_image_name(instance, 'image')
+
+
+@receiver(post_save, sender=Image)
+def build_image_derivatives(sender, instance, **kwargs):
+    name = get_image_name(instance, 'image')
+    if name != instance._image_name and not instance.image_derivatives:
+        schedule_derivatives(Image, instance.pk, 'image')
+    instance._image_name = name
+
+
+@receiver(post_delete, sender=ImageProduct)
+def release_unlinked_image(sender, instance, **kwargs):
+    transaction.on_commit(lambda: release_images([instance.image_id]))
+
+
+@receiver(post_delete, sender=Image)
+def delete_unused_image_file(sender, instance, **kwargs):
+    name = get_image_name(instance, 'image')
+    derivatives = instance.image_derivatives
+    transaction.on_commit(lambda: delete_unused_file(name, derivatives))
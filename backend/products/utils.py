@@ -1,3 +1,5 @@
+from hashlib import sha256
+
 from django.conf import settings
 
 
@@ -15,3 +17,20 @@ def cut_string(
         Текст строки с добавлением многоточия, если оно больше заданной длины.
     """
     return field[:cut_out] + '…' if len(field) > cut_out else field
+
+
+def get_file_hash(file) -> str:
+    """Считает SHA-256 содержимого файла, читая его частями.
+
+    Args:
+        file: Файл Django.
+
+    Returns:
+        Шестнадцатеричный хеш содержимого.
+    """
+    digest = sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("users", "0005_alter_user_username"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="seller",
+            name="logo_derivatives",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                verbose_name="уменьшенные копии логотипа",
+            ),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="photo_derivatives",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                verbose_name="уменьшенные копии фотографии",
+            ),
+        ),
+    ]
@@ -64,6 +64,12 @@ class User(AbstractUser, TimestampedModel):
         blank=True,
         null=True,
     )
+    photo_derivatives = models.JSONField(
+        'уменьшенные копии фотографии',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     is_seller = models.BooleanField(default=False)
 
     objects = CustomUserManager()
@@ -102,6 +108,12 @@ class Seller(TimestampedModel):
         blank=True,
         null=True,
     )
+    logo_derivatives = models.JSONField(
+        'уменьшенные копии логотипа',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     store_name = models.TextField(
         'название магазина',
         max_length=25,
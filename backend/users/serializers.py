@@ -3,7 +3,7 @@ from djoser.conf import settings
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 
-from api.fields import Base64ImageField
+from api.fields import Base64ImageField, SrcsetField
 from users.models import Seller
 
 User = get_user_model()
@@ -13,6 +13,7 @@ class CustomUserSerializer(UserSerializer):
     '''Сериализатор для модели User.'''
 
     photo = Base64ImageField(required=False)
+    photo_srcset = SrcsetField(source='photo_derivatives')
 
     class Meta:
         model = User
@@ -24,6 +25,7 @@ class CustomUserSerializer(UserSerializer):
             'last_name',
             'phone',
             'photo',
+            'photo_srcset',
             'is_seller',
         )
 
@@ -128,6 +130,7 @@ class SellerSerializer(serializers.ModelSerializer):
     '''Сериализатор для обновления данных продавца.'''
 
     logo = Base64ImageField(required=False)
+    logo_srcset = SrcsetField(source='logo_derivatives')
 
     class Meta:
         model = Seller
@@ -136,6 +139,7 @@ class SellerSerializer(serializers.ModelSerializer):
             'user',
             'inn',
             'logo',
+            'logo_srcset',
             'store_name',
             'organization_name',
             'organization_type',
@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from core.images import (
+    delete_derivatives,
+    get_image_name,
+    schedule_derivatives,
+)
+from users.models import Seller, User
+
+IMAGE_FIELDS = {User: 'photo', Seller: 'logo'}
+
+
+@receiver(post_init, sender=User)
+@receiver(post_init, sender=Seller)
+def remember_image_name(sender, instance, **kwargs):
+    instance._image_name = get_image_name(instance, IMAGE_FIELDS[sender])
+
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=Seller)
+def reset_image_derivatives(sender, instance, **kwargs):
+    '''Сбрасывает копии старого файла при смене изображения.
+
+    Пока новые копии не построены, отдаётся только оригинал, а их
+    появление меняет отпечаток ETag товаров магазина.
+    '''
+
+    field_name = IMAGE_FIELDS[sender]
+    if get_image_name(instance, field_name) == instance._image_name:
+        return
+    derivatives_field = f'{field_name}_derivatives'
+    derivatives = getattr(instance, derivatives_field)
+    if derivatives:
+        setattr(instance, derivatives_field, {})
+        transaction.on_commit(lambda: delete_derivatives(derivatives))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Seller)
+def build_image_derivatives(sender, instance, **kwargs):
+    name = get_image_name(instance, IMAGE_FIELDS[sender])
+    if name != instance._image_name:
+        schedule_derivatives(sender, instance.pk, IMAGE_FIELDS[sender])
+    instance._image_name = name